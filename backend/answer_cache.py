@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# /backend/answer_cache.py
+
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+class SemanticAnswerCache:
+    """Caches generated answers keyed on the question's embedding.
+
+    A lookup hits when a stored question has cosine similarity of at least
+    `threshold` with the new one and is younger than `ttl` seconds. At most
+    `max_entries` answers are kept, evicting the least recently used.
+    """
+
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def lookup(self, embedding):
+        """Return (response, similarity) for the closest fresh entry, or None."""
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl]:
+                del self._entries[key]
+
+            best_key, best_similarity = None, self.threshold
+            for key, entry in self._entries.items():
+                similarity = float(np.dot(entry["vector"], query))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best_key]
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            self.saved_ms += entry["latency_ms"]
+            return entry["response"], best_similarity
+
+    def store(self, embedding, response, latency_ms):
+        """Remember `response`, which took `latency_ms` to produce."""
+        with self._lock:
+            self._entries[self._next_key] = {
+                "vector": self._normalize(embedding),
+                "response": response,
+                "created": time.monotonic(),
+                "latency_ms": latency_ms,
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry, e.g. after the index the answers came from is replaced."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_ms": round(self.saved_ms, 2),
+            }
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype='float32').reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
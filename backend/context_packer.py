@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# /backend/context_packer.py
+
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Gemini averages roughly four characters of English text per token; close enough
+# for budgeting without a tokenizer round trip.
+CHARS_PER_TOKEN = 4
+OVERLAP_PROBE_CHARS = 50
+NEAR_DUPLICATE_JACCARD = 0.8
+
+def estimate_tokens(text: str):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def history_tokens(history: list):
+    return sum(estimate_tokens(f"{msg['role']}: {msg['content']}") for msg in history)
+
+def _shingles(text, size=5):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+def _strip_overlap(previous: str, text: str):
+    """Remove the part of `text` that repeats `previous` at either end.
+
+    Consecutive chunks of a document share an overlap window (see
+    ingest.chunk_text), so the second one usually starts with the tail of
+    the first, or ends with its head when retrieved in the other order.
+    """
+    if text in previous:
+        return ""
+    pos = previous.find(text[:OVERLAP_PROBE_CHARS])
+    if pos >= 0 and text.startswith(previous[pos:]):
+        text = text[len(previous) - pos:].lstrip()
+    pos = text.find(previous[:OVERLAP_PROBE_CHARS])
+    if pos >= 0 and previous.startswith(text[pos:]):
+        text = text[:pos].rstrip()
+    return text
+
+def _truncate(text: str, max_tokens: int):
+    """Cut `text` to about max_tokens, preferring to end on a sentence boundary."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    boundary = max(cut.rfind(". "), cut.rfind(".\n"))
+    if boundary > limit // 2:
+        return cut[:boundary + 1]
+    return cut.rsplit(" ", 1)[0] + " ..."
+
+class ContextPacker:
+    """Assembles prompt context within a token budget.
+
+    Retrieved passages are taken in rank order, with overlapping and
+    near-duplicate chunks removed, until `local_budget` tokens are used; the
+    last passage that does not fit is truncated. Web snippets get their own
+    `web_budget`. Conversation history keeps the last `keep_messages` messages
+    verbatim and replaces older ones by a summary, which only moves forward in
+    blocks of `summary_block` messages so it can be reused across turns.
+    """
+
+    def __init__(self, summarize, local_budget=3000, web_budget=800, keep_messages=6,
+                 summary_block=6, min_passage_tokens=40, summary_cache_size=1000):
+        self.summarize = summarize
+        self.local_budget = local_budget
+        self.web_budget = web_budget
+        self.keep_messages = keep_messages
+        self.summary_block = summary_block
+        self.min_passage_tokens = min_passage_tokens
+        self.summary_cache_size = summary_cache_size
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pack_passages(self, docs: list):
+        """Return (context_text, passages_used) for docs in rank order."""
+        selected = []
+        used = 0
+        for doc in docs:
+            text = doc['text']
+            for previous in selected:
+                if previous['source'] == doc.get('source'):
+                    text = _strip_overlap(previous['text'], text)
+                if not text:
+                    break
+            if not text:
+                continue
+            shingles = _shingles(text)
+            if any(len(shingles & prev['shingles']) / len(shingles | prev['shingles']) >= NEAR_DUPLICATE_JACCARD
+                   for prev in selected):
+                continue
+
+            remaining = self.local_budget - used
+            if remaining < self.min_passage_tokens:
+                break
+            text = _truncate(text, remaining)
+            selected.append({"source": doc.get('source'), "text": text, "shingles": shingles})
+            used += estimate_tokens(text)
+
+        return "\n\n".join(passage['text'] for passage in selected), len(selected)
+
+    def pack_web(self, web_context: str):
+        """Keep whole web snippets, in order, while they fit the web budget."""
+        kept = []
+        used = 0
+        for snippet in web_context.split("\n\n"):
+            tokens = estimate_tokens(snippet)
+            if used + tokens > self.web_budget:
+                if not kept:
+                    kept.append(_truncate(snippet, self.web_budget))
+                break
+            kept.append(snippet)
+            used += tokens
+        return "\n\n".join(kept)
+
+    def compact_history(self, history: list):
+        """Return history with old messages folded into a (cached) summary message.
+
+        When the boundary advances by one block, the previous block's summary is
+        reused and only the newly folded messages are summarized on top of it.
+        """
+        boundary = ((len(history) - self.keep_messages) // self.summary_block) * self.summary_block
+        if boundary <= 0:
+            return history
+
+        key = self._key(history[:boundary])
+        summary = self._cached(key)
+        if summary is None:
+            previous = None
+            if boundary > self.summary_block:
+                previous = self._cached(self._key(history[:boundary - self.summary_block]))
+            if previous is not None:
+                to_summarize = [{"role": "summary", "content": previous}] + history[boundary - self.summary_block:boundary]
+            else:
+                to_summarize = history[:boundary]
+            summary = self.summarize(to_summarize)
+            with self._lock:
+                self._summaries[key] = summary
+                while len(self._summaries) > self.summary_cache_size:
+                    self._summaries.popitem(last=False)
+
+        return [{"role": "summary", "content": summary}] + history[boundary:]
+
+    @staticmethod
+    def _key(messages):
+        joined = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        return hashlib.sha256(joined.encode('utf-8')).hexdigest()
+
+    def _cached(self, key):
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+            return summary
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# /backend/embedding_cache.py
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+class EmbeddingCache:
+    """Two-tier cache of embeddings keyed on (model, normalized text).
+
+    The first tier is an in-process LRU. When `db_path` is given, entries are also
+    written to a SQLite file so they survive restarts and are shared by workers.
+    """
+
+    def __init__(self, max_entries=10000, db_path=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        """Return this process's SQLite connection, opening it on first use.
+
+        Connections must not cross a fork, so a worker forked from a preloaded
+        master opens its own.
+        """
+        if not self.db_path:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text))"
+            )
+            self._db.commit()
+            self._db_pid = os.getpid()
+        return self._db
+
+    @staticmethod
+    def normalize(text: str):
+        return " ".join(text.split()).casefold()
+
+    def get(self, model: str, text: str):
+        key = (model, self.normalize(text))
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text = ?", key
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype='float32')
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, vector):
+        key = (model, self.normalize(text))
+        vector = np.asarray(vector, dtype='float32').reshape(-1)
+        with self._lock:
+            self._remember(key, vector)
+            db = self._connection()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                    (key[0], key[1], vector.tobytes())
+                )
+                db.commit()
+
+    def get_or_compute(self, model: str, texts: list, compute):
+        """Return a (len(texts), dim) matrix, calling `compute` once for all misses."""
+        vectors = [self.get(model, text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = compute([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                self.put(model, texts[i], vector)
+                vectors[i] = np.asarray(vector, dtype='float32').reshape(-1)
+        return np.vstack(vectors).astype('float32')
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "persistent": bool(self.db_path),
+            }
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
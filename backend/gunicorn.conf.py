@@ -0,0 +1,37 @@
+# /backend/gunicorn.conf.py
+#
+# Production serving for the RAG service:
+#   gunicorn -c gunicorn.conf.py rag_service:app
+#
+# The app is imported once in the master (preload_app) so the FAISS index, lexical
+# index and chunk store are loaded before forking and shared copy-on-write by the
+# workers. Each worker serves requests on a pool of threads; most of a request is
+# spent waiting on Gemini and Custom Search, so threads scale better than processes.
+# Background init (RAG_BACKGROUND_INIT=1) is only supported without preloading.
+#
+# With INDEX_WATCH_INTERVAL set, every worker watches the vector store's CURRENT
+# file and hot-reloads new versions itself; threads do not survive fork, so the
+# watcher is started per worker in post_fork.
+
+import os
+import multiprocessing
+
+bind = os.getenv("RAG_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("RAG_WORKERS", min(multiprocessing.cpu_count(), 4)))
+worker_class = "gthread"
+threads = int(os.getenv("RAG_THREADS", "8"))
+# RAG_BACKGROUND_INIT=1 loads the store in a thread, which would run only in a
+# preloaded master and never reach the forked workers; it therefore turns preloading
+# off, and every worker loads its own copy in the background.
+background_init = os.getenv("RAG_BACKGROUND_INIT") == "1"
+preload_app = os.getenv("RAG_PRELOAD", "1") == "1" and not background_init
+# Streaming responses can take as long as the longest generation.
+timeout = int(os.getenv("RAG_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+errorlog = "-"
+
+def post_fork(server, worker):
+    import rag_service
+    rag_service.start_index_watcher()
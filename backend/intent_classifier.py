@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# /backend/intent_classifier.py
+
+import re
+import threading
+
+import numpy as np
+
+ACKNOWLEDGEMENTS = frozenset(
+    "ok okay thanks thank you thx great cool got it fine sure noted understood alright".split())
+FOLLOW_UP_OPENERS = ("what about", "and ", "also", "but ", "so ", "then ", "how about", "what if",
+                     "can you", "could you", "why", "is that", "does that", "does it", "is it")
+
+def _words(text: str):
+    return re.findall(r"\w+", text.lower())
+
+def _cosine(a, b):
+    a = np.asarray(a, dtype='float32').reshape(-1)
+    b = np.asarray(b, dtype='float32').reshape(-1)
+    denominator = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / denominator if denominator else 0.0
+
+class FastIntentClassifier:
+    """Decides easy intent cases locally so they skip the intent-analysis LLM call.
+
+    `classify` returns the same {"response_type", "search_query"} dict as
+    RAGSystem.analyze_user_intent, or None when the case is not clear-cut:
+
+    - an opening question of at least `min_question_words` words is a new
+      structured question, searched as-is;
+    - a follow-up that is an acknowledgement, or is short and close in embedding
+      space (cosine >= `follow_up_similarity`) to the previous user message, is
+      conversational and searched together with that message;
+    - a longer follow-up far from the previous user message (cosine <
+      `new_topic_similarity`) starts a new structured question.
+
+    Embeddings come from `embed`, normally the cached query embedder, so the
+    latest message is usually embedded once for both this check and retrieval.
+    """
+
+    def __init__(self, embed, min_question_words=5, short_follow_up_words=12,
+                 follow_up_similarity=0.75, new_topic_similarity=0.35, enabled=True):
+        self.embed = embed
+        self.min_question_words = min_question_words
+        self.short_follow_up_words = short_follow_up_words
+        self.follow_up_similarity = follow_up_similarity
+        self.new_topic_similarity = new_topic_similarity
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.fast_path = 0
+        self.fallbacks = 0
+
+    def classify(self, history: list):
+        intent = self._classify(history) if self.enabled else None
+        with self._lock:
+            if intent is None:
+                self.fallbacks += 1
+            else:
+                self.fast_path += 1
+        return intent
+
+    def _classify(self, history):
+        latest = history[-1]['content'].strip()
+        words = _words(latest)
+        previous = next((msg['content'] for msg in reversed(history[:-1]) if msg['role'] == 'user'), None)
+
+        if previous is None:
+            if len(words) >= self.min_question_words and not set(words) <= ACKNOWLEDGEMENTS:
+                return {"response_type": "structured", "search_query": latest}
+            return None
+
+        if words and set(words) <= ACKNOWLEDGEMENTS:
+            return {"response_type": "conversational", "search_query": previous}
+
+        similarity = _cosine(self.embed(latest), self.embed(previous))
+        if len(words) <= self.short_follow_up_words:
+            opener = latest.lower().startswith(FOLLOW_UP_OPENERS)
+            if similarity >= self.follow_up_similarity or (opener and similarity >= self.new_topic_similarity):
+                return {"response_type": "conversational", "search_query": f"{previous} {latest}"}
+        elif similarity < self.new_topic_similarity:
+            return {"response_type": "structured", "search_query": latest}
+        return None
+
+    def stats(self):
+        with self._lock:
+            decisions = self.fast_path + self.fallbacks
+            return {
+                "enabled": self.enabled,
+                "llm_calls_avoided": self.fast_path,
+                "llm_fallbacks": self.fallbacks,
+                "fast_path_rate": round(self.fast_path / decisions, 4) if decisions else 0.0,
+            }
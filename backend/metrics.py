@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# /backend/metrics.py
+#
+# Minimal Prometheus metrics and per-request tracing for the RAG service.
+#
+# Set METRICS_ENABLED=0 to turn everything off: `traced` then returns the
+# decorated function unchanged and `span` is a shared no-op context manager, so
+# the instrumented code paths cost one flag check at most.
+
+import os
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series["counts"]):
+                    cumulative += count
+                    labels = _format_labels(list(zip(self.labelnames, key)) + [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(list(zip(self.labelnames, key)))
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Register a callable returning [(name, type, help, [(labels_dict, value)])] at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, metric_type, documentation, samples in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds", "Time spent in each RAG pipeline stage.", ["stage"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "rag_stage_errors_total", "Exceptions raised by each RAG pipeline stage.", ["stage"]))
+TOKENS = REGISTRY.register(Histogram(
+    "rag_generation_tokens", "Tokens per generative model call.", ["stage", "kind"], buckets=COUNT_BUCKETS))
+RETRIEVED_CHUNKS = REGISTRY.register(Histogram(
+    "rag_retrieved_chunks", "Chunks returned per local search.", ["mode"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)))
+REQUESTS = REGISTRY.register(Counter(
+    "rag_requests_total", "Requests handled per endpoint and status code.", ["endpoint", "status"]))
+INTENT_DECISIONS = REGISTRY.register(Counter(
+    "rag_intent_decisions_total", "Intent decisions by the local fast path or the generative model.", ["path"]))
+INDEX_RELOADS = REGISTRY.register(Counter(
+    "rag_index_reloads_total", "Vector store reload attempts by outcome.", ["status"]))
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+def start_trace():
+    """Begin collecting spans for the current request; returns the span list."""
+    trace = []
+    _current_trace.set(trace)
+    return trace
+
+@contextmanager
+def _span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append({"stage": stage, "duration_ms": round(elapsed * 1000, 2),
+                          "thread": threading.current_thread().name})
+
+def span(stage):
+    """Context manager timing a block as `stage`; a no-op when metrics are disabled."""
+    return _span(stage) if ENABLED else nullcontext()
+
+def traced(stage):
+    """Decorator recording every call of the function as a `stage` span."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_usage(stage, response):
+    """Record prompt/completion token counts from a Gemini response, if it has them."""
+    usage = getattr(response, "usage_metadata", None)
+    if not ENABLED or usage is None:
+        return
+    for kind, field in (("prompt", "prompt_token_count"), ("completion", "candidates_token_count")):
+        count = getattr(usage, field, None)
+        if count:
+            TOKENS.observe(count, stage=stage, kind=kind)
+
+def submit(executor, func, *args, **kwargs):
+    """executor.submit that carries the current trace into the worker thread."""
+    context = contextvars.copy_context()
+    return executor.submit(context.run, func, *args, **kwargs)
@@ -2,21 +2,37 @@
 # /backend/rag_service.py
 
 import os
+import re
 import sys
+import hmac
 import json
-from flask import Flask, request, jsonify
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import faiss
 import numpy as np
 import google.generativeai as genai
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 from google.generativeai.types import GenerationConfig
 
 # Add the rag_backup directory to the path
 RAG_BACKUP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rag_backup")
 sys.path.append(RAG_BACKUP_DIR)
 
+from embedder import get_embedder, embed_in_batches
+from lexical_index import citation_share, reciprocal_rank_fusion
+from vector_index import apply_search_params, search_index
+from sharded_store import load_vector_store, resolve_store_dir
+from embedding_cache import EmbeddingCache
+from answer_cache import SemanticAnswerCache
+from structured_stream import StructuredSectionParser
+from web_search import WebSearcher, get_search_backend
+from context_packer import ContextPacker, estimate_tokens, history_tokens
+from intent_classifier import FastIntentClassifier
+from reranker import get_reranker
+import metrics
+
 # Load environment variables
 dotenv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env")
 load_dotenv(dotenv_path=dotenv_path)
@@ -24,50 +40,339 @@ load_dotenv(dotenv_path=dotenv_path)
 app = Flask(__name__)
 CORS(app)
 
+# Shared pool for running retrieval stages concurrently with intent analysis.
+# Threads are only started on first use.
+pipeline_executor = ThreadPoolExecutor(max_workers=int(os.getenv("RAG_PIPELINE_WORKERS", "16")))
+# Minimum word overlap between the raw message and the rewritten search query for
+# the speculative retrieval results to be reused.
+SPECULATION_SIMILARITY = float(os.getenv("SPECULATION_SIMILARITY", "0.6"))
+STOPWORDS = frozenset("a an and are as at be by can do for from how i if in is it me my of on or the to what when which who why with".split())
+
+DEFAULT_VECTOR_STORE_DIR = os.path.join(RAG_BACKUP_DIR, "vector_store")
+
 class RAGSystem:
-    def __init__(self):
+    def __init__(self, vector_store_dir=DEFAULT_VECTOR_STORE_DIR, embedder=None, generative_model=None, search_backend=None):
+        """Load the vector store and set up model clients.
+
+        `embedder`, `generative_model` and `search_backend` default to the ones
+        configured by the environment; passing them in allows offline use with
+        fakes, e.g. in bench_rag.py.
+        """
         print("Initializing RAG System...")
         
-        # Use paths relative to rag_backup
-        vector_store_dir = os.path.join(RAG_BACKUP_DIR, "vector_store")
-        index_path = os.path.join(vector_store_dir, "faiss_index.bin")
-        chunks_path = os.path.join(vector_store_dir, "legal_chunks.json")
-
-        if not os.path.exists(index_path) or not os.path.exists(chunks_path):
-            raise FileNotFoundError(f"Vector store not found. Please run 'build_index.py'.")
-
-        self.index = faiss.read_index(index_path)
-        self.chunks = json.load(open(chunks_path, 'r', encoding='utf-8'))
+        self.vector_store_dir = vector_store_dir
+        # Replaced as a whole by reload(); searches take one reference and use only it.
+        self.store = self._open_store()
+        self._reload_lock = threading.Lock()
+        self.reload_status = {"state": "idle", "last_result": None, "last_error": None, "last_attempt": None}
+        self._watcher_pid = None
+        self._watcher_lock = threading.Lock()
+        # 'vector', 'lexical' or 'hybrid'; anything but 'vector' needs lexical_index.npz.
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid")
+        self.citation_share_threshold = float(os.getenv("LEXICAL_ONLY_CITATION_SHARE", "0.5"))
+        # Second stage: over-fetch RERANK_CANDIDATES chunks, rescore them against the
+        # query, and keep the top_k scoring at least RERANK_MIN_SCORE (but never fewer
+        # than RERANK_MIN_KEEP, so a question is not left without local context).
+        # A cross-encoder model is loaded here, not on the first request.
+        self.reranker = get_reranker()
+        self.rerank_candidates = int(os.getenv("RERANK_CANDIDATES", "50"))
+        self.rerank_min_score = float(os.getenv("RERANK_MIN_SCORE", "0"))
+        self.rerank_min_keep = int(os.getenv("RERANK_MIN_KEEP", "1"))
         
         gemini_api_key = os.getenv("GEMINI_API_KEY")
         genai.configure(api_key=gemini_api_key)
         self.embedding_model = "models/text-embedding-004"
-        self.generative_model = genai.GenerativeModel('gemini-1.5-flash-latest')
+        self.embedder = embedder or get_embedder(model_name=self.embedding_model)
+        self.embedding_cache = EmbeddingCache(
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+            db_path=os.getenv("EMBEDDING_CACHE_PATH") or None
+        )
+        self.answer_cache = SemanticAnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+        )
+        self.generative_model = generative_model or genai.GenerativeModel('gemini-1.5-flash-latest')
         
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
         self.cse_id = os.getenv("CSE_ID")
+        self.web_searcher = WebSearcher(
+            search_backend or get_search_backend(api_key=self.google_api_key, cse_id=self.cse_id),
+            timeout=float(os.getenv("WEB_SEARCH_TIMEOUT", "4")),
+            cache_ttl=float(os.getenv("WEB_SEARCH_CACHE_TTL", "900")),
+            cache_size=int(os.getenv("WEB_SEARCH_CACHE_SIZE", "1000"))
+        )
+        self.context_packer = ContextPacker(
+            self.summarize_conversation,
+            local_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+            web_budget=int(os.getenv("WEB_CONTEXT_TOKEN_BUDGET", "800")),
+            keep_messages=int(os.getenv("HISTORY_KEEP_MESSAGES", "6")),
+            summary_block=int(os.getenv("HISTORY_SUMMARY_BLOCK", "6"))
+        )
+        self.intent_classifier = FastIntentClassifier(
+            lambda text: self._get_query_embedding(text)[0],
+            follow_up_similarity=float(os.getenv("INTENT_FOLLOW_UP_SIMILARITY", "0.75")),
+            new_topic_similarity=float(os.getenv("INTENT_NEW_TOPIC_SIMILARITY", "0.35")),
+            enabled=os.getenv("INTENT_FAST_PATH", "1") == "1"
+        )
         print("RAG System Initialized.")
 
+    def _open_store(self):
+        # Plain or sharded (shards.json), following CURRENT for versioned stores; a
+        # sharded index searches its shards in parallel.
+        store = load_vector_store(self.vector_store_dir,
+                                  search_workers=int(os.getenv("SHARD_SEARCH_WORKERS", "0")) or None)
+        for knob, env_var in (("nprobe", "FAISS_NPROBE"), ("ef_search", "FAISS_EF_SEARCH")):
+            if os.getenv(env_var):
+                store.index_params[knob] = int(os.getenv(env_var))
+        apply_search_params(store.index, store.index_params)
+        return store
+
+    @property
+    def index(self):
+        return self.store.index
+
+    @property
+    def index_params(self):
+        return self.store.index_params
+
+    @property
+    def chunks(self):
+        return self.store.chunks
+
+    @property
+    def lexical_index(self):
+        return self.store.lexical_index
+
+    @property
+    def filter_index(self):
+        return self.store.filter_index
+
+    def reload(self, force: bool = False):
+        """Load the live vector store again and swap it in without pausing searches.
+
+        The new store is loaded in the calling thread while requests keep using
+        the old one; the swap is a single reference assignment. Unless `force`,
+        nothing is loaded when CURRENT still names the loaded version. Returns
+        "reloaded", "unchanged", or "busy" when another reload is running; load
+        errors propagate and leave the old store serving.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return "busy"
+        try:
+            self.reload_status.update(state="reloading", last_attempt=time.time())
+            old_store = self.store
+            _, version = resolve_store_dir(self.vector_store_dir)
+            if not force and version is not None and version == old_store.version:
+                result = "unchanged"
+            else:
+                start = time.perf_counter()
+                self.store = self._open_store()
+                # Cached answers were generated from the old index.
+                self.answer_cache.clear()
+                print(f"Vector store reloaded in {time.perf_counter() - start:.2f}s: "
+                      f"{old_store.version or old_store.path} -> {self.store.version or self.store.path}")
+                result = "reloaded"
+            self.reload_status.update(last_result=result, last_error=None)
+            if metrics.ENABLED:
+                metrics.INDEX_RELOADS.inc(status=result)
+            return result
+        except Exception as e:
+            self.reload_status.update(last_result="failed", last_error=str(e))
+            if metrics.ENABLED:
+                metrics.INDEX_RELOADS.inc(status="failed")
+            raise
+        finally:
+            self.reload_status["state"] = "idle"
+            self._reload_lock.release()
+
+    def start_index_watcher(self, interval: float):
+        """Poll CURRENT every `interval` seconds and reload when it names a new version.
+
+        Threads do not survive fork, so gunicorn workers call this again after
+        forking; it starts at most one watcher per process.
+        """
+        with self._watcher_lock:
+            if interval <= 0 or self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                _, version = resolve_store_dir(self.vector_store_dir)
+                if version is None or version == self.store.version:
+                    continue
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"Vector store reload of version {version} failed: {e}")
+
+        threading.Thread(target=watch, daemon=True, name="index-watcher").start()
+
+    def store_info(self):
+        store = self.store
+        return {
+            "path": store.path,
+            "version": store.version,
+            "shards": store.num_shards,
+            "index_type": store.index_params.get("index_type"),
+            "compression": store.index_params.get("compression", "none"),
+            "chunks": len(store.chunks),
+            "loaded_at": store.loaded_at,
+            "reload": dict(self.reload_status),
+        }
+
+    @metrics.traced("embedding")
     def _get_query_embedding(self, query: str):
-        result = genai.embed_content(model=self.embedding_model, content=query)
-        return np.array([result['embedding']]).astype('float32')
+        return self.embedding_cache.get_or_compute(self.embedder.model_name, [query], self.embedder.embed)
+
+    @metrics.traced("embedding")
+    def _get_query_embeddings(self, queries: list):
+        """Embed many queries, sending all cache misses in as few API calls as possible."""
+        def compute(texts):
+            if len(texts) <= self.embedder.max_batch_size:
+                return self.embedder.embed(texts)
+            return embed_in_batches(self.embedder, texts)
+        return self.embedding_cache.get_or_compute(self.embedder.model_name, queries, compute)
+
+    def _vector_search(self, store, queries: list, top_k: int, nprobe: int = None, ef_search: int = None, ids=None):
+        """Return a list of (chunk id, distance) per query from a single multi-query index search."""
+        if len(queries) == 1:
+            query_embeddings = self._get_query_embedding(queries[0])
+        else:
+            query_embeddings = self._get_query_embeddings(queries)
+        with metrics.span("faiss_search"):
+            distances, indices = search_index(store.index, query_embeddings, top_k,
+                                              {"nprobe": nprobe, "ef_search": ef_search}, ids)
+        return [[(int(i), float(distance)) for i, distance in zip(id_row, distance_row) if i >= 0]
+                for id_row, distance_row in zip(indices, distances)]
+
+    def _lexical_search(self, store, query: str, top_k: int, ids=None):
+        with metrics.span("lexical_search"):
+            return store.lexical_index.search(query, top_k, None if ids is None else ids.ids)
+
+    def select_chunks(self, filters: dict, store=None):
+        """IdSelection of the chunks matching metadata `filters`, or None for no filters.
+
+        Raises ValueError for malformed filters.
+        """
+        if not filters:
+            return None
+        if not isinstance(filters, dict):
+            raise ValueError("filters must be an object mapping a field to a value or list of values")
+        filter_index = (store or self.store).filter_index
+        if filter_index is None:
+            raise ValueError("This vector store has no metadata for filtering")
+        return filter_index.select(filters)
+
+    @metrics.traced("local_search")
+    def search_local_docs(self, query: str, top_k: int = 5, nprobe: int = None, ef_search: int = None,
+                          mode: str = None, filters: dict = None, rerank: bool = True):
+        """Return the top_k chunks for `query` as [{"source", "text", "act", "year", "doc_type", "score"}].
+
+        In 'hybrid' mode BM25 and vector rankings are fused with reciprocal rank
+        fusion; queries that are mostly statutory citations ("Article 21") are
+        answered from the lexical index alone, without an embedding call, unless
+        it has no match for them. `filters` (e.g. {"doc_type": "act"}) restricts
+        both searches to the matching chunks through the precomputed filter index.
+
+        With a reranker configured (and `rerank`), the first stage fetches
+        `rerank_candidates` chunks and the reranker picks the top_k, dropping
+        those below `rerank_min_score`; "score" is the reranker's relevance in
+        [0, 1]. Without reranking, "score" is the first-stage score: the L2
+        distance for vector search (lower is closer), BM25 for lexical and the
+        fusion score for hybrid.
+        """
+        return self._search_local_docs([query], top_k, nprobe, ef_search, mode, filters, rerank)[0]
+
+    @metrics.traced("batch_local_search")
+    def search_local_docs_batch(self, queries: list, top_k: int = 5, nprobe: int = None, ef_search: int = None,
+                                mode: str = None, filters: dict = None, rerank: bool = True):
+        """search_local_docs for many queries, embedded together and searched as one matrix."""
+        return self._search_local_docs(queries, top_k, nprobe, ef_search, mode, filters, rerank)
+
+    def _search_local_docs(self, queries, top_k, nprobe, ef_search, mode, filters, rerank=True):
+        # Chunk ids are only meaningful within one store, so a reload mid-search
+        # must not mix versions: every stage below uses this snapshot.
+        store = self.store
+        mode = mode or self.retrieval_mode
+        if mode != "vector" and store.lexical_index is None:
+            mode = "vector"
 
-    def search_local_docs(self, query: str, top_k: int = 5):
-        query_embedding = self._get_query_embedding(query)
-        distances, indices = self.index.search(query_embedding, top_k)
-        results = [{"source": self.chunks[i].get('source', 'Unknown'), "text": self.chunks[i].get('text', '')} for i in indices[0]]
+        subset = self.select_chunks(filters, store)
+        if subset is not None and not len(subset):
+            return [self._chunk_results(store, [], mode) for _ in queries]
+
+        reranker = self.reranker if rerank else None
+        fetch_k = max(top_k, self.rerank_candidates) if reranker else top_k
+
+        def finish(query, hits, result_mode):
+            ids, scores = [doc_id for doc_id, _ in hits], [score for _, score in hits]
+            if reranker is not None:
+                ids, scores = self._rerank(store, reranker, query, ids, top_k)
+            return self._chunk_results(store, ids, result_mode, scores)
+
+        results = [None] * len(queries)
+        if mode == "hybrid":
+            for i, query in enumerate(queries):
+                if citation_share(query) >= self.citation_share_threshold:
+                    hits = self._lexical_search(store, query, fetch_k, subset)
+                    if hits:
+                        results[i] = finish(query, hits, "lexical")
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        pending_queries = [queries[i] for i in pending]
+
+        if mode == "vector":
+            hit_lists = self._vector_search(store, pending_queries, fetch_k, nprobe, ef_search, subset)
+        elif mode == "lexical":
+            hit_lists = [self._lexical_search(store, query, fetch_k, subset) for query in pending_queries]
+        else:
+            candidates = max(top_k * 4, fetch_k)
+            lexical_lists = [self._lexical_search(store, query, candidates, subset) for query in pending_queries]
+            vector_lists = self._vector_search(store, pending_queries, candidates, nprobe, ef_search, subset)
+            hit_lists = [reciprocal_rank_fusion([[doc_id for doc_id, _ in vector_hits],
+                                                 [doc_id for doc_id, _ in lexical_hits]])[:fetch_k]
+                         for vector_hits, lexical_hits in zip(vector_lists, lexical_lists)]
+
+        for i, hits in zip(pending, hit_lists):
+            results[i] = finish(queries[i], hits, mode)
         return results
 
+    def _rerank(self, store, reranker, query, ids, top_k):
+        """Return (ids, scores) of the best top_k of `ids` by reranker score, best first."""
+        if not ids:
+            return [], []
+        with metrics.span("rerank"):
+            # In first-stage order, which the lexical reranker uses as a prior.
+            scores = reranker.score(query, [store.chunks[i].get('text', '') for i in ids])
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        kept = [j for j in order if scores[j] >= self.rerank_min_score]
+        if len(kept) < self.rerank_min_keep:
+            kept = list(order[:self.rerank_min_keep])
+        return [ids[j] for j in kept], [float(scores[j]) for j in kept]
+
+    def _chunk_results(self, store, ids, mode, scores=None):
+        if metrics.ENABLED:
+            metrics.RETRIEVED_CHUNKS.observe(len(ids), mode=mode)
+        results = []
+        for n, i in enumerate(ids):
+            chunk = store.chunks[i]
+            result = {"source": chunk.get('source', 'Unknown'), "text": chunk.get('text', '')}
+            result.update((field, chunk[field]) for field in ("act", "year", "doc_type") if chunk.get(field) is not None)
+            if scores is not None:
+                result["score"] = round(float(scores[n]), 4)
+            results.append(result)
+        return results
+
+    @metrics.traced("web_search")
     def search_web(self, query: str):
-        try:
-            service = build("customsearch", "v1", developerKey=self.google_api_key)
-            res = service.cse().list(q=query, cx=self.cse_id, num=3).execute()
-            snippets = [f"Source: {item['link']}\nSnippet: {item['snippet']}" for item in res.get('items', [])]
-            return "\n\n".join(snippets) if snippets else "No relevant web results found."
-        except Exception as e:
-            print(f"An error occurred during web search: {e}")
-            return "Could not perform a web search at this time."
+        return self.web_searcher.search(query)
 
+    @metrics.traced("intent_analysis")
     def analyze_user_intent(self, conversation_history: list):
         """Analyzes the conversation to determine intent and create a better search query."""
         
@@ -98,16 +403,30 @@ class RAGSystem:
         
         generation_config = GenerationConfig(response_mime_type="application/json", response_schema=json_schema)
         response = self.generative_model.generate_content(prompt, generation_config=generation_config)
+        metrics.record_usage("intent_analysis", response)
         
         return json.loads(response.text)
 
-    def generate_response(self, query: str, local_context: str, web_context: str, response_type: str):
-        """Generates either a structured or conversational response."""
+    def classify_intent(self, conversation_history: list, compact=None):
+        """Return (intent, source, prompt_history), trying the local classifier before the model.
 
-        if response_type == 'structured':
-            return self.generate_structured_response(query, local_context, web_context)
-        else:
-            prompt = f"""
+        The local classifier reads the raw history. Only the model prompt needs
+        bounding, so `compact` (default: context_packer.compact_history) runs on
+        the model path alone; prompt_history is the history sent to the model, or
+        None when the fast path decided.
+        """
+        intent = self.intent_classifier.classify(conversation_history)
+        source = "fast_path" if intent is not None else "model"
+        prompt_history = None
+        if intent is None:
+            prompt_history = (compact or self.context_packer.compact_history)(conversation_history)
+            intent = self.analyze_user_intent(prompt_history)
+        if metrics.ENABLED:
+            metrics.INTENT_DECISIONS.inc(path=source)
+        return intent, source, prompt_history
+
+    def _conversational_prompt(self, query: str, local_context: str, web_context: str):
+        return f"""
             You are "Legal Sahayak," an expert AI legal assistant.
             A user has asked a follow-up question: "{query}"
             
@@ -124,10 +443,8 @@ class RAGSystem:
 
             CONVERSATIONAL ANSWER:
             """
-            response = self.generative_model.generate_content(prompt)
-            return {"response_text": response.text}
 
-    def generate_structured_response(self, query: str, local_context: str, web_context: str):
+    def _structured_prompt(self, query: str, local_context: str, web_context: str):
         json_schema = {
             "type": "object",
             "properties": {
@@ -149,9 +466,97 @@ class RAGSystem:
         LATEST WEB SEARCH RESULTS: {web_context}
         ---
         """
+        return prompt, generation_config
+
+    @metrics.traced("generation")
+    def generate_response(self, query: str, local_context: str, web_context: str, response_type: str):
+        """Generates either a structured or conversational response."""
+
+        if response_type == 'structured':
+            return self.generate_structured_response(query, local_context, web_context)
+        else:
+            prompt = self._conversational_prompt(query, local_context, web_context)
+            response = self.generative_model.generate_content(prompt)
+            metrics.record_usage("generation", response)
+            return {"response_text": response.text}
+
+    def generate_structured_response(self, query: str, local_context: str, web_context: str):
+        prompt, generation_config = self._structured_prompt(query, local_context, web_context)
         response = self.generative_model.generate_content(prompt, generation_config=generation_config)
+        metrics.record_usage("generation", response)
         return json.loads(response.text)
 
+    def stream_response(self, query: str, local_context: str, web_context: str, response_type: str):
+        """Streams a response as (event, data) pairs while the model generates it.
+
+        Conversational answers yield a "token" event per generated chunk. Structured
+        answers yield a "section" event as each top-level field of the JSON object is
+        completed. Both finish with a "response" event carrying the same object
+        generate_response would have returned.
+        """
+        if response_type == 'structured':
+            prompt, generation_config = self._structured_prompt(query, local_context, web_context)
+            parser = StructuredSectionParser()
+            text = ""
+            chunk = None
+            with metrics.span("generation_stream"):
+                for chunk in self.generative_model.generate_content(prompt, generation_config=generation_config, stream=True):
+                    text += chunk.text
+                    for name, value in parser.feed(chunk.text):
+                        yield "section", {"name": name, "value": value}
+            metrics.record_usage("generation", chunk)
+            yield "response", json.loads(text)
+        else:
+            prompt = self._conversational_prompt(query, local_context, web_context)
+            text = ""
+            chunk = None
+            with metrics.span("generation_stream"):
+                for chunk in self.generative_model.generate_content(prompt, stream=True):
+                    text += chunk.text
+                    yield "token", {"text": chunk.text}
+            metrics.record_usage("generation", chunk)
+            yield "response", {"response_text": text}
+
+    def answer_batch(self, queries: list, top_k: int = 5, response_type: str = "structured",
+                     web_search: bool = False, concurrency: int = 8, generate: bool = True, filters: dict = None):
+        """Answer independent questions in bulk, yielding one result dict per query.
+
+        Retrieval for the whole batch is one embedding pass and one index search.
+        Generation (and web search, if enabled) then runs on at most `concurrency`
+        threads, and results are yielded as they complete, each carrying the
+        `index` of its query. The questions are taken as standalone, so there is
+        no intent analysis; `response_type` applies to all of them. Closing the
+        generator early cancels the questions not yet started.
+        """
+        local_results = self.search_local_docs_batch(queries, top_k=top_k, filters=filters)
+
+        def answer(i):
+            query = queries[i]
+            docs = local_results[i]
+            result = {"index": i, "query": query, "sources": [doc['source'] for doc in docs],
+                      "scores": [doc['score'] for doc in docs]}
+            if not generate:
+                result["documents"] = docs
+                return result
+            try:
+                local_context, _ = self.context_packer.pack_passages(docs)
+                web_context = self.context_packer.pack_web(self.search_web(query)) if web_search else ""
+                result["response"] = self.generate_response(query, local_context, web_context, response_type)
+            except Exception as e:
+                print(f"Batch query {i} failed: {e}")
+                result["error"] = "An internal error occurred"
+            return result
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(queries))))
+        try:
+            futures = [metrics.submit(executor, answer, i) for i in range(len(queries))]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Closing the generator (client disconnect) drops the calls that have not started.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @metrics.traced("summarize")
     def summarize_conversation(self, conversation_history: list):
         """Summarizes the conversation using the generative model."""
         history_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_history])
@@ -169,14 +574,197 @@ class RAGSystem:
         """
 
         response = self.generative_model.generate_content(prompt)
+        metrics.record_usage("summarize", response)
         return response.text
 
 # Initialize RAG system
-try:
-    rag_system = RAGSystem()
-except Exception as e:
-    print(f"Failed to initialize RAG system: {e}")
-    rag_system = None
+rag_system = None
+# Seconds between checks of the vector store's CURRENT file; 0 disables the watcher.
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "0"))
+# Token for /admin/reload; the endpoint is disabled when unset.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+rag_system_state = "loading"
+# Set by start_index_watcher() in processes that serve requests.
+watch_index = False
+
+def init_rag_system():
+    global rag_system, rag_system_state
+    try:
+        rag_system = RAGSystem()
+        rag_system_state = "ready"
+        if watch_index:
+            # Requested while the system was still loading in the background.
+            rag_system.start_index_watcher(INDEX_WATCH_INTERVAL)
+    except Exception as e:
+        print(f"Failed to initialize RAG system: {e}")
+        rag_system_state = "failed"
+
+# Under gunicorn (preload_app) this runs once in the master before workers fork, so
+# the index and chunk store are shared copy-on-write. RAG_BACKGROUND_INIT=1 loads
+# in a thread instead, letting the process pass liveness checks while it warms up;
+# threads do not survive fork, so gunicorn.conf.py disables preloading with it.
+if os.getenv("RAG_BACKGROUND_INIT") == "1":
+    threading.Thread(target=init_rag_system, daemon=True).start()
+else:
+    init_rag_system()
+
+def _timed(timings, stage, func, *args, **kwargs):
+    """Call func and record its wall time in milliseconds under timings[stage]."""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+def query_similarity(a: str, b: str):
+    """Jaccard overlap of the lower-cased content words of two queries."""
+    words_a = set(re.findall(r"\w+", a.lower())) - STOPWORDS
+    words_b = set(re.findall(r"\w+", b.lower())) - STOPWORDS
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+def retrieve_context(history: list, timings: dict, filters: dict = None):
+    """Run intent analysis and retrieval for a conversation, overlapping the two.
+
+    Local and web retrieval start speculatively on the raw latest message while
+    the intent is analysed. If the rewritten search query is close enough to that
+    message the speculative results are used; otherwise both searches are rerun
+    concurrently with the rewritten query. `filters` restricts local retrieval
+    to chunks with matching metadata.
+    """
+    latest_query = history[-1]['content']
+
+    speculative_local = metrics.submit(
+        pipeline_executor, _timed, timings, "speculative_local_search", rag_system.search_local_docs, latest_query,
+        filters=filters)
+    speculative_web = metrics.submit(
+        pipeline_executor, _timed, timings, "speculative_web_search", rag_system.search_web, latest_query)
+
+    # Analyze intent and get a better search query. When the model is needed, older
+    # turns are first folded into a cached summary so its prompt stays bounded; that
+    # compaction is timed separately and also counts towards intent_analysis.
+    def compact(messages):
+        return _timed(timings, "history_compaction", rag_system.context_packer.compact_history, messages)
+    intent, intent_source, prompt_history = _timed(
+        timings, "intent_analysis", rag_system.classify_intent, history, compact)
+    response_type = intent.get('response_type', 'conversational')
+    search_query = intent.get('search_query', latest_query)
+    print(f"Intent Analysis ({intent_source}) - Type: {response_type}, Search Query: {search_query}")
+
+    reused = query_similarity(search_query, latest_query) >= SPECULATION_SIMILARITY
+    if reused:
+        local_docs = speculative_local.result()
+        web_context = speculative_web.result()
+    else:
+        # Search local and web docs with the improved query
+        local_future = metrics.submit(
+            pipeline_executor, _timed, timings, "local_search", rag_system.search_local_docs, search_query,
+            filters=filters)
+        web_future = metrics.submit(
+            pipeline_executor, _timed, timings, "web_search", rag_system.search_web, search_query)
+        local_docs = local_future.result()
+        web_context = web_future.result()
+
+    return {
+        "response_type": response_type,
+        "search_query": search_query,
+        "intent_source": intent_source,
+        "local_docs": local_docs,
+        "web_context": web_context,
+        "speculative_retrieval_reused": reused,
+        # No history reaches a prompt when the fast path decides.
+        "history_tokens": ((history_tokens(history), history_tokens(prompt_history))
+                           if prompt_history is not None else (0, 0)),
+    }
+
+def assemble_context(retrieval: dict, timings: dict):
+    """Pack retrieved passages and web results within the token budget.
+
+    Returns (local_context, web_context, stats); stats counts the estimated
+    prompt tokens before and after packing, including history compaction.
+    """
+    start = time.perf_counter()
+    packer = rag_system.context_packer
+    local_docs = retrieval['local_docs']
+    local_context, passages_used = packer.pack_passages(local_docs)
+    web_context = packer.pack_web(retrieval['web_context'])
+    timings["context_assembly"] = round((time.perf_counter() - start) * 1000, 2)
+
+    history_before, history_after = retrieval['history_tokens']
+    before = (sum(estimate_tokens(doc['text']) for doc in local_docs)
+              + estimate_tokens(retrieval['web_context']) + history_before)
+    after = estimate_tokens(local_context) + estimate_tokens(web_context) + history_after
+    stats = {
+        "tokens_before": before,
+        "tokens_after": after,
+        "tokens_saved": before - after,
+        "passages_used": passages_used,
+        "passages_retrieved": len(local_docs),
+        "sources": [{"source": doc['source'], "score": doc.get('score')} for doc in local_docs],
+    }
+    return local_context, web_context, stats
+
+def lookup_cached_answer(history: list, timings: dict, filters: dict = None):
+    """Return (query_embedding, cache_hit) for a single-turn conversation.
+
+    Only unfiltered opening questions are answered from the semantic answer cache;
+    follow-ups depend on the rest of the conversation. Returns (None, None) when
+    the cache does not apply.
+    """
+    if not rag_system.answer_cache.enabled or len(history) != 1 or filters:
+        return None, None
+    query_embedding = _timed(timings, "answer_cache_lookup", rag_system._get_query_embedding, history[-1]['content'])
+    return query_embedding, rag_system.answer_cache.lookup(query_embedding)
+
+def run_chat_pipeline(history: list, filters: dict = None):
+    """Answer the latest message in `history`. Returns (response, metadata)."""
+    trace = metrics.start_trace()
+    timings = {}
+    start = time.perf_counter()
+    latest_query = history[-1]['content']
+
+    # Answers are cached only if the store they were retrieved from is still loaded.
+    store = rag_system.store
+    query_embedding, cache_hit = lookup_cached_answer(history, timings, filters)
+    if cache_hit:
+        cached_response, similarity = cache_hit
+        timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+        return cached_response, {
+            "response_type": "structured",
+            "answer_cache": {"hit": True, "similarity": round(similarity, 4)},
+            "timings_ms": dict(timings),
+            "trace": list(trace),
+        }
+
+    retrieval = retrieve_context(history, timings, filters)
+    local_context, web_context, context_stats = assemble_context(retrieval, timings)
+
+    # Generate the appropriate response
+    final_response = _timed(
+        timings, "generation", rag_system.generate_response,
+        query=latest_query,
+        local_context=local_context,
+        web_context=web_context,
+        response_type=retrieval['response_type']
+    )
+    timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+
+    if query_embedding is not None and retrieval['response_type'] == 'structured' and rag_system.store is store:
+        rag_system.answer_cache.store(query_embedding, final_response, timings["total"])
+
+    metadata = {
+        "response_type": retrieval['response_type'],
+        "search_query": retrieval['search_query'],
+        "intent_source": retrieval['intent_source'],
+        "speculative_retrieval_reused": retrieval['speculative_retrieval_reused'],
+        "context": context_stats,
+        "timings_ms": dict(timings),
+        "trace": list(trace),
+    }
+    if filters:
+        metadata["filters"] = filters
+    return final_response, metadata
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -189,37 +777,285 @@ def chat():
         
         if not history:
             return jsonify({"error": "History cannot be empty"}), 400
-        
-        latest_query = history[-1]['content']
 
-        # Analyze intent and get a better search query
-        intent = rag_system.analyze_user_intent(history)
-        response_type = intent.get('response_type', 'conversational')
-        search_query = intent.get('search_query', latest_query)
-        print(f"Intent Analysis - Type: {response_type}, Search Query: {search_query}")
-
-        # Search local and web docs with the improved query
-        local_docs = rag_system.search_local_docs(query=search_query)
-        local_context = "\n\n".join([doc['text'] for doc in local_docs])
-        web_context = rag_system.search_web(query=search_query)
-        
-        # Generate the appropriate response
-        final_response = rag_system.generate_response(
-            query=latest_query,
-            local_context=local_context,
-            web_context=web_context,
-            response_type=response_type
-        )
+        filters = data.get('filters')
+        try:
+            rag_system.select_chunks(filters)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        return jsonify({"response": final_response})
+        final_response, metadata = run_chat_pipeline(history, filters)
+        return jsonify({"response": final_response, "metadata": metadata})
         
     except Exception as e:
         print(f"An error occurred in the chat endpoint: {e}")
         return jsonify({"error": "An internal error occurred"}), 500
 
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# top_k also sizes the candidate lists of every query in the batch's single matrix search.
+BATCH_MAX_TOP_K = int(os.getenv("BATCH_MAX_TOP_K", "20"))
+
+def _positive_int(data: dict, name: str, default: int, maximum: int):
+    """Read a positive integer option, capped at `maximum`; raises ValueError when invalid."""
+    value = data.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return min(value, maximum)
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer many standalone questions in one request, streamed back as JSON lines.
+
+    Body: {"queries": [...], "top_k": 5, "response_type": "structured",
+    "web_search": false, "concurrency": 8, "generate": true, "filters": {...}}. Each output line
+    is one result with the `index` of its query, in completion order; the last
+    line is {"done": true, ...} with counts and the total time.
+    """
+    if not rag_system:
+        return jsonify({"error": "RAG system not available"}), 500
+
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries', [])
+
+    if not isinstance(queries, list) or not queries or not all(isinstance(query, str) and query.strip() for query in queries):
+        return jsonify({"error": "queries must be a non-empty list of strings"}), 400
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({"error": f"At most {BATCH_MAX_QUERIES} queries per batch"}), 400
+
+    response_type = data.get('response_type', 'structured')
+    if response_type not in ('structured', 'conversational'):
+        return jsonify({"error": "response_type must be 'structured' or 'conversational'"}), 400
+
+    try:
+        options = {
+            "top_k": _positive_int(data, 'top_k', 5, BATCH_MAX_TOP_K),
+            "response_type": response_type,
+            "web_search": bool(data.get('web_search', False)),
+            "concurrency": _positive_int(data, 'concurrency', 8, BATCH_MAX_CONCURRENCY),
+            "generate": bool(data.get('generate', True)),
+            "filters": data.get('filters'),
+        }
+        rag_system.select_chunks(options["filters"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def lines():
+        # Not returned, but keeps this batch's spans off any earlier request's trace.
+        metrics.start_trace()
+        start = time.perf_counter()
+        errors = 0
+        try:
+            for result in rag_system.answer_batch(queries, **options):
+                errors += "error" in result
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"An error occurred in the batch endpoint: {e}")
+            yield json.dumps({"error": "An internal error occurred"}) + "\n"
+            return
+        yield json.dumps({
+            "done": True,
+            "count": len(queries),
+            "errors": errors,
+            "total_ms": round((time.perf_counter() - start) * 1000, 2),
+        }) + "\n"
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _sse(event: str, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-Sent Events version of /api/chat.
+
+    Emits a "metadata" event once retrieval is done, then "token" (conversational)
+    or "section" (structured) events as the model generates, and finally "done"
+    with the complete response and per-stage timings.
+    """
+    if not rag_system:
+        return jsonify({"error": "RAG system not available"}), 500
+
+    data = request.get_json()
+    history = data.get('history', [])
+
+    if not history:
+        return jsonify({"error": "History cannot be empty"}), 400
+
+    filters = data.get('filters')
+    try:
+        rag_system.select_chunks(filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def events():
+        trace = metrics.start_trace()
+        timings = {}
+        start = time.perf_counter()
+        try:
+            store = rag_system.store
+            query_embedding, cache_hit = lookup_cached_answer(history, timings, filters)
+            if cache_hit:
+                cached_response, similarity = cache_hit
+                timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+                yield _sse("metadata", {"response_type": "structured", "timings_ms": dict(timings)})
+                for name, value in cached_response.items():
+                    yield _sse("section", {"name": name, "value": value})
+                yield _sse("done", {"response": cached_response, "metadata": {
+                    "answer_cache": {"hit": True, "similarity": round(similarity, 4)},
+                    "timings_ms": timings,
+                    "trace": list(trace),
+                }})
+                return
+
+            retrieval = retrieve_context(history, timings, filters)
+            yield _sse("metadata", {
+                "response_type": retrieval['response_type'],
+                "search_query": retrieval['search_query'],
+                "intent_source": retrieval['intent_source'],
+                "timings_ms": dict(timings),
+            })
+
+            local_context, web_context, context_stats = assemble_context(retrieval, timings)
+            generation_start = time.perf_counter()
+            first_chunk_ms = None
+            final_response = None
+            for event, payload in rag_system.stream_response(
+                query=history[-1]['content'],
+                local_context=local_context,
+                web_context=web_context,
+                response_type=retrieval['response_type']
+            ):
+                if first_chunk_ms is None:
+                    first_chunk_ms = round((time.perf_counter() - generation_start) * 1000, 2)
+                if event == "response":
+                    final_response = payload
+                else:
+                    yield _sse(event, payload)
+
+            timings["generation_first_chunk"] = first_chunk_ms
+            timings["generation"] = round((time.perf_counter() - generation_start) * 1000, 2)
+            timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+            if (query_embedding is not None and retrieval['response_type'] == 'structured'
+                    and rag_system.store is store):
+                rag_system.answer_cache.store(query_embedding, final_response, timings["total"])
+            yield _sse("done", {"response": final_response, "metadata": {
+                "context": context_stats,
+                "timings_ms": timings,
+                "trace": list(trace),
+            }})
+        except Exception as e:
+            print(f"An error occurred in the chat stream endpoint: {e}")
+            yield _sse("error", {"error": "An internal error occurred"})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/api/filters', methods=['GET'])
+def filter_values():
+    """Metadata values that can be used in the `filters` of chat requests."""
+    if not rag_system:
+        return jsonify({"error": "RAG system not available"}), 500
+    if rag_system.filter_index is None:
+        return jsonify({})
+    return jsonify(rag_system.filter_index.values())
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({"status": "healthy", "rag_system": rag_system is not None})
+    health_info = {"status": "healthy", "rag_system": rag_system is not None, "state": rag_system_state}
+    if rag_system:
+        health_info["embedding_cache"] = rag_system.embedding_cache.stats()
+        health_info["answer_cache"] = rag_system.answer_cache.stats()
+        health_info["web_search_cache"] = rag_system.web_searcher.stats()
+        health_info["intent_classifier"] = rag_system.intent_classifier.stats()
+        health_info["vector_store"] = rag_system.store_info()
+    return jsonify(health_info)
+
+def start_index_watcher():
+    """Start this process's vector store watcher, now or once the RAG system has loaded.
+
+    Called by gunicorn's post_fork hook and the development server, never at
+    import: a preloading master serves no requests, and a worker forked while
+    the master was reloading would inherit its reload lock held.
+    """
+    global watch_index
+    watch_index = True
+    if rag_system:
+        rag_system.start_index_watcher(INDEX_WATCH_INTERVAL)
+
+def _reload_in_background(force):
+    try:
+        rag_system.reload(force=force)
+    except Exception as e:
+        print(f"Vector store reload failed: {e}")
+
+@app.route('/admin/reload', methods=['GET', 'POST'])
+def admin_reload():
+    """POST loads the live vector store again and swaps it in; GET reports the loaded store.
+
+    The reload runs in the background: POST returns 202 at once, and the
+    outcome appears under "reload" in GET. Only the worker that receives the
+    request reloads; with several gunicorn workers use INDEX_WATCH_INTERVAL.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin endpoints are disabled; set ADMIN_TOKEN"}), 404
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"error": "Invalid admin token"}), 403
+    if not rag_system:
+        return jsonify({"error": "RAG system not available"}), 500
+    if request.method == 'GET':
+        return jsonify(rag_system.store_info())
+
+    if rag_system.reload_status["state"] == "reloading":
+        return jsonify({"status": "busy", **rag_system.store_info()}), 409
+    force = (request.get_json(silent=True) or {}).get("force", False)
+    threading.Thread(target=_reload_in_background, args=(bool(force),), daemon=True).start()
+    return jsonify({"status": "accepted", **rag_system.store_info()}), 202
+
+def collect_cache_metrics():
+    """Cache counters for /metrics, read from the live RAG system at scrape time."""
+    if not rag_system:
+        return []
+    caches = {
+        "embedding": rag_system.embedding_cache.stats(),
+        "answer": rag_system.answer_cache.stats(),
+        "web_search": rag_system.web_searcher.stats(),
+    }
+    hits = [({"cache": name}, stats["hits"] + stats.get("disk_hits", 0)) for name, stats in caches.items()]
+    misses = [({"cache": name}, stats["misses"]) for name, stats in caches.items()]
+    ratios = [({"cache": name}, stats["hit_rate"]) for name, stats in caches.items()]
+    entries = [({"cache": name}, stats["entries"]) for name, stats in caches.items()]
+    return [
+        ("rag_cache_hits_total", "counter", "Cache lookups that hit.", hits),
+        ("rag_cache_misses_total", "counter", "Cache lookups that missed.", misses),
+        ("rag_cache_hit_ratio", "gauge", "Fraction of cache lookups that hit.", ratios),
+        ("rag_cache_entries", "gauge", "Entries currently held in each cache.", entries),
+    ]
+
+metrics.REGISTRY.add_collector(collect_cache_metrics)
+
+@app.after_request
+def count_request(response):
+    if metrics.ENABLED:
+        metrics.REQUESTS.inc(endpoint=request.endpoint or "unknown", status=response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of this process's metrics."""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """The process is up and serving requests."""
+    return jsonify({"status": "alive"})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """The RAG system is loaded and can answer chat requests."""
+    status_code = 200 if rag_system_state == "ready" else 503
+    return jsonify({"status": rag_system_state}), status_code
 
 @app.route('/api/summarize', methods=['POST'])
 def summarize():
@@ -241,4 +1077,6 @@ def summarize():
         return jsonify({"error": "An internal error occurred"}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    # Development server only; use gunicorn with gunicorn.conf.py in production.
+    start_index_watcher()
+    app.run(host='0.0.0.0', port=5001, debug=os.getenv("FLASK_DEBUG", "1") == "1")
@@ -38,6 +38,64 @@ app.post('/api/chat', async (req, res) => {
   }
 });
 
+// Proxy streaming chat requests (Server-Sent Events) to RAG service
+app.post('/api/chat/stream', async (req, res) => {
+  try {
+    if (!req.body || !req.body.history) {
+      return res.status(400).json({ error: 'Request body must contain history array' });
+    }
+
+    const response = await axios.post(`${RAG_SERVICE_URL}/api/chat/stream`, req.body, {
+      responseType: 'stream'
+    });
+    res.setHeader('Content-Type', 'text/event-stream');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.flushHeaders();
+    response.data.on('error', (error) => {
+      console.error('Chat stream from RAG service failed:', error.message);
+      res.end();
+    });
+    response.data.pipe(res);
+    // express.json has already consumed the request, so only the response reports a
+    // client disconnect; stop the upstream generation when it happens.
+    res.on('close', () => response.data.destroy());
+  } catch (error) {
+    console.error('Error forwarding stream request to RAG service:', error.message);
+    res.status(500).json({
+      error: 'Failed to process request',
+      details: error.message
+    });
+  }
+});
+
+// Proxy batch requests (JSON lines) to RAG service
+app.post('/api/chat/batch', async (req, res) => {
+  try {
+    if (!req.body || !Array.isArray(req.body.queries)) {
+      return res.status(400).json({ error: 'Request body must contain queries array' });
+    }
+
+    const response = await axios.post(`${RAG_SERVICE_URL}/api/chat/batch`, req.body, {
+      responseType: 'stream'
+    });
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    res.flushHeaders();
+    response.data.on('error', (error) => {
+      console.error('Batch stream from RAG service failed:', error.message);
+      res.end();
+    });
+    response.data.pipe(res);
+    // As for /api/chat/stream: a batch can run for minutes, so stop it on disconnect.
+    res.on('close', () => response.data.destroy());
+  } catch (error) {
+    console.error('Error forwarding batch request to RAG service:', error.message);
+    res.status(500).json({
+      error: 'Failed to process request',
+      details: error.message
+    });
+  }
+});
+
 // Health check for RAG service
 app.get('/api/rag-health', async (req, res) => {
   try {
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# /backend/structured_stream.py
+
+import json
+
+class StructuredSectionParser:
+    """Incrementally parses a streamed JSON object and reports finished top-level fields.
+
+    Feed it text fragments as the model produces them; every call returns the
+    (key, value) pairs whose values became complete, so a structured answer can be
+    sent section by section instead of after the closing brace.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self.finished = False
+        self.result = {}
+
+    def feed(self, fragment: str):
+        self._buffer += fragment
+        sections = []
+
+        if not self._started:
+            start = self._buffer.find("{")
+            if start < 0:
+                return sections
+            self._pos = start + 1
+            self._started = True
+
+        while not self.finished:
+            pos = self._skip(self._pos, " \t\r\n,")
+            if pos >= len(self._buffer):
+                break
+            if self._buffer[pos] == "}":
+                self.finished = True
+                break
+
+            try:
+                key, pos = self._decoder.raw_decode(self._buffer, pos)
+                pos = self._skip(pos, " \t\r\n")
+                if pos >= len(self._buffer):
+                    break
+                if self._buffer[pos] != ":":
+                    raise ValueError(f"Expected ':' after key {key!r}")
+                pos = self._skip(pos + 1, " \t\r\n")
+                value, pos = self._decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                # The current field is still being streamed.
+                break
+
+            # A bare number could still grow ("12" of "12.5"); it is complete only once
+            # a delimiter follows. Strings, arrays and objects end with their own.
+            if isinstance(value, (int, float)) and (pos >= len(self._buffer) or self._buffer[pos] not in " \t\r\n,}"):
+                break
+
+            self.result[key] = value
+            sections.append((key, value))
+            self._pos = pos
+
+        return sections
+
+    def _skip(self, pos, characters):
+        while pos < len(self._buffer) and self._buffer[pos] in characters:
+            pos += 1
+        return pos
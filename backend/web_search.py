@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# /backend/web_search.py
+
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import httplib2
+from googleapiclient.discovery import build
+
+NO_RESULTS_MESSAGE = "No relevant web results found."
+UNAVAILABLE_MESSAGE = "Could not perform a web search at this time."
+
+class CustomSearchBackend:
+    """Google Custom Search through a fixed pool of discovery clients.
+
+    The clients are built once; each one owns its own HTTP connection, since
+    httplib2 connections must not be shared between threads.
+    """
+
+    def __init__(self, api_key, cse_id, pool_size=4, http_timeout=10.0):
+        self.cse_id = cse_id
+        self._clients = queue.Queue()
+        for _ in range(pool_size):
+            http = httplib2.Http(timeout=http_timeout)
+            self._clients.put(build("customsearch", "v1", developerKey=api_key, http=http, cache_discovery=False))
+
+    def search(self, query: str, num: int = 3):
+        service = self._clients.get()
+        try:
+            res = service.cse().list(q=query, cx=self.cse_id, num=num).execute()
+            return res.get('items', [])
+        finally:
+            self._clients.put(service)
+
+class StubSearchBackend:
+    """Offline backend returning canned results after an optional delay."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def search(self, query: str, num: int = 3):
+        if self.latency:
+            time.sleep(self.latency)
+        return [{"link": f"https://example.invalid/result/{i + 1}", "snippet": f"Stub result {i + 1} for: {query}"}
+                for i in range(num)]
+
+def get_search_backend(name=None, api_key=None, cse_id=None):
+    """Return the backend selected by `name` or the WEB_SEARCH_BACKEND environment variable."""
+    name = (name or os.getenv("WEB_SEARCH_BACKEND", "google")).lower()
+    if name == "google":
+        return CustomSearchBackend(api_key, cse_id, pool_size=int(os.getenv("WEB_SEARCH_POOL_SIZE", "4")))
+    if name == "stub":
+        return StubSearchBackend(latency=float(os.getenv("WEB_SEARCH_STUB_LATENCY", "0")))
+    raise ValueError(f"Unknown web search backend: {name}")
+
+class WebSearcher:
+    """Formats web search results for prompts, with a TTL cache and a time budget.
+
+    A search that does not finish within `timeout` seconds is abandoned and the
+    caller gets the usual "could not search" message, so a slow search engine
+    cannot hold up a chat request. Only successful searches are cached.
+    """
+
+    def __init__(self, backend, timeout=4.0, cache_ttl=900, cache_size=1000, max_workers=8):
+        self.backend = backend
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    @staticmethod
+    def normalize(query: str):
+        return " ".join(query.split()).casefold()
+
+    def search(self, query: str):
+        key = self.normalize(query)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+
+        future = self._executor.submit(self.backend.search, query)
+        try:
+            items = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            print(f"Web search timed out after {self.timeout}s")
+            return UNAVAILABLE_MESSAGE
+        except Exception as e:
+            print(f"An error occurred during web search: {e}")
+            return UNAVAILABLE_MESSAGE
+
+        snippets = [f"Source: {item['link']}\nSnippet: {item['snippet']}" for item in items]
+        result = "\n\n".join(snippets) if snippets else NO_RESULTS_MESSAGE
+        self._put_cached(key, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "timeouts": self.timeouts,
+            }
+
+    def _get_cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.cache_ttl:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._cache[key]
+            self.misses += 1
+            return None
+
+    def _put_cached(self, key, result):
+        with self._lock:
+            self._cache[key] = (time.monotonic(), result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
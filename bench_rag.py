@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# bench_rag.py
+#
+# Offline latency and throughput benchmark for the RAG pipeline. The embedder,
+# generative model and web search are replaced by fakes with configurable latency,
+# so results are reproducible and no network access or API key is needed.
+#
+#   python3 bench_rag.py --queries traces.jsonl --concurrency 8 --requests 200
+#   python3 bench_rag.py --build-sizes 100,1000,5000
+#   python3 bench_rag.py --compression all --index-type hnsw
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, "backend"))
+sys.path.append(os.path.join(ROOT_DIR, "rag_backup"))
+
+# The service module builds its default RAGSystem at import time; keep that offline too.
+os.environ.setdefault("EMBEDDER", "local")
+os.environ.setdefault("WEB_SEARCH_BACKEND", "stub")
+
+from embedder import LocalEmbedder
+from web_search import StubSearchBackend
+from build_index import build_index
+from vector_index import COMPRESSION_TYPES, compression_report
+from sharded_store import load_shards_manifest, resolve_store_dir
+from reranker import get_reranker
+
+SAMPLE_QUERIES = [
+    "What are my rights if a product I bought is defective?",
+    "Can I file a consumer complaint online?",
+    "What does Article 21 of the Constitution protect?",
+    "Which consumer commission hears a claim of 50 lakh rupees?",
+    "Is a person who buys goods for resale a consumer?",
+    "What is the time limit for filing a consumer complaint?",
+    "Explain Section 35 of the Consumer Protection Act",
+    "What did the Supreme Court hold in Maneka Gandhi v Union of India?",
+]
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel with a fixed latency per call.
+
+    Streaming calls spread the same latency over `stream_chunks` chunks.
+    """
+
+    def __init__(self, latency=0.5, stream_chunks=10):
+        self.latency = latency
+        self.stream_chunks = stream_chunks
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        if '"brain" of a legal chatbot' in prompt:
+            time.sleep(self.latency)
+            latest_message = re.findall(r"user: (.*)", prompt)[-1]
+            return FakeResponse(json.dumps({"response_type": "structured", "search_query": latest_message}))
+
+        if generation_config is not None:
+            text = json.dumps({
+                "summaryOfRights": "You are entitled to a replacement or refund.",
+                "relevantActsAndArticles": [{"name": "Consumer Protection Act, 2019", "explanation": "Defines consumer rights."}],
+                "similarCaseLaw": [{"name": "Example v Example", "principle": "Illustrative principle."}],
+                "nextSteps": ["Send a written notice to the seller.", "File a complaint with the District Commission."],
+            })
+        else:
+            text = "You can approach the consumer commission for relief. " * 5
+
+        if not stream:
+            time.sleep(self.latency)
+            return FakeResponse(text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        size = max(1, len(text) // self.stream_chunks)
+        for start in range(0, len(text), size):
+            time.sleep(self.latency / self.stream_chunks)
+            yield FakeResponse(text[start:start + size])
+
+def load_queries(path):
+    """Read a JSON-lines trace; each line has `history`, `query` or `title`."""
+    if not path:
+        return [[{"role": "user", "content": query}] for query in SAMPLE_QUERIES]
+
+    histories = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "history" in record:
+                histories.append(record["history"])
+            else:
+                histories.append([{"role": "user", "content": record.get("query") or record["title"]}])
+    return histories
+
+def percentiles(values):
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)}
+
+def make_system(args):
+    import rag_service
+
+    system = rag_service.RAGSystem(
+        vector_store_dir=args.vector_store_dir,
+        embedder=LocalEmbedder(latency=args.embed_latency),
+        generative_model=FakeGenerativeModel(latency=args.llm_latency),
+        search_backend=StubSearchBackend(latency=args.web_latency),
+    )
+    if args.reranker:
+        system.reranker = get_reranker(args.reranker)
+    if args.no_cache:
+        system.embedding_cache.max_entries = 0
+        system.answer_cache.max_entries = 0
+        system.web_searcher.cache_size = 0
+    rag_service.rag_system = system
+    rag_service.rag_system_state = "ready"
+    return rag_service, system
+
+def bench_retrieval(system, histories, repeat):
+    """Latency of RAGSystem.search_local_docs alone, in milliseconds."""
+    latencies = []
+    for _ in range(repeat):
+        for history in histories:
+            start = time.perf_counter()
+            system.search_local_docs(history[-1]['content'])
+            latencies.append((time.perf_counter() - start) * 1000)
+    return percentiles(latencies)
+
+def bench_rerank(system, histories, candidate_counts, repeat):
+    """Reranker latency per query for each candidate count, and its share of a search.
+
+    Candidates are the first-stage results without reranking, so the numbers
+    isolate the cost of scoring them.
+    """
+    if system.reranker is None:
+        return None
+    queries = [history[-1]['content'] for history in histories]
+    results = {"reranker": system.reranker.name, "min_score": system.rerank_min_score, "per_candidates": []}
+    for count in candidate_counts:
+        candidates = [system.search_local_docs(query, top_k=count, rerank=False) for query in queries]
+        latencies = []
+        for _ in range(repeat):
+            for query, docs in zip(queries, candidates):
+                start = time.perf_counter()
+                system.reranker.score(query, [doc['text'] for doc in docs])
+                latencies.append((time.perf_counter() - start) * 1000)
+        results["per_candidates"].append({
+            "candidates": count,
+            "scored_per_query": round(sum(len(docs) for docs in candidates) / len(candidates), 1),
+            "rerank_ms": percentiles(latencies),
+        })
+
+    kept = [len(system.search_local_docs(query)) for query in queries]
+    results["chunks_kept_per_query"] = round(sum(kept) / len(kept), 2)
+    results["search_ms"] = {
+        "without_rerank": bench_search(system, queries, repeat, rerank=False),
+        "with_rerank": bench_search(system, queries, repeat, rerank=True),
+    }
+    return results
+
+def bench_search(system, queries, repeat, rerank):
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            system.search_local_docs(query, rerank=rerank)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return percentiles(latencies)
+
+def bench_endpoint(rag_service, histories, path, concurrency, num_requests):
+    """Replay `num_requests` chats against a Flask endpoint at fixed concurrency."""
+    client = rag_service.app.test_client()
+    stage_timings = {}
+    latencies = []
+    errors = 0
+
+    def one_request(i):
+        history = histories[i % len(histories)]
+        start = time.perf_counter()
+        response = client.post(path, json={"history": history})
+        body = response.get_data(as_text=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        if path.endswith("/stream"):
+            # The final "done" event carries the metadata.
+            lines = body.strip().splitlines()
+            payload = json.loads(lines[-1][len("data: "):]) if lines and lines[-1].startswith("data: ") else {}
+        else:
+            payload = json.loads(body) if body else {}
+        return response.status_code, elapsed, payload.get("metadata", {}).get("timings_ms", {})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for status, elapsed, timings in executor.map(one_request, range(num_requests)):
+            if status != 200:
+                errors += 1
+            latencies.append(elapsed)
+            for stage, value in timings.items():
+                if value is not None:
+                    stage_timings.setdefault(stage, []).append(value)
+    wall_time = time.perf_counter() - start
+
+    return {
+        "endpoint": path,
+        "concurrency": concurrency,
+        "requests": num_requests,
+        "errors": errors,
+        "throughput_rps": round(num_requests / wall_time, 2),
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {stage: percentiles(values) for stage, values in sorted(stage_timings.items())},
+    }
+
+def bench_endpoint_runs(args, histories, path):
+    """Benchmark an endpoint on a fresh RAGSystem with empty caches, then again with the caches warm.
+
+    Every endpoint gets its own system, so one endpoint's run never warms the
+    caches another is measured with. With --no-cache only the cold run is made.
+    """
+    rag_service, _ = make_system(args)
+    runs = {"endpoint": path, "cold": bench_endpoint(rag_service, histories, path, args.concurrency, args.requests)}
+    if not args.no_cache:
+        runs["warm"] = bench_endpoint(rag_service, histories, path, args.concurrency, args.requests)
+    return runs
+
+def bench_build(sizes, embed_latency, index_type):
+    """Time build_index over synthetic corpora of `sizes` documents."""
+    rng = np.random.default_rng(0)
+    words = ("consumer goods service complaint commission defect refund seller article section "
+             "constitution right court judgment appeal liability product warranty notice").split()
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as corpus_dir, tempfile.TemporaryDirectory() as store_dir:
+            for i in range(size):
+                with open(os.path.join(corpus_dir, f"doc_{i}.txt"), 'w', encoding='utf-8') as f:
+                    f.write(" ".join(rng.choice(words, 500)))
+            start = time.perf_counter()
+            build_index(corpus_dir=corpus_dir, vector_store_dir=store_dir,
+                        embedder=LocalEmbedder(latency=embed_latency), index_type=index_type)
+            results.append({"documents": size, "index_type": index_type,
+                            "build_seconds": round(time.perf_counter() - start, 3)})
+    return results
+
+def load_store_embeddings(vector_store_dir):
+    """The float32 embeddings of the live build, concatenated over shards.
+
+    Read from embeddings.npy, or for stores built without it (older builds)
+    reconstructed from an uncompressed flat index. Raises ValueError otherwise.
+    """
+    store_dir, _ = resolve_store_dir(vector_store_dir)
+    manifest = load_shards_manifest(store_dir)
+    dirs = [os.path.join(store_dir, shard["path"]) for shard in manifest["shards"]] if manifest else [store_dir]
+    parts = []
+    for directory in dirs:
+        embeddings_path = os.path.join(directory, "embeddings.npy")
+        if os.path.exists(embeddings_path):
+            parts.append(np.load(embeddings_path).astype('float32'))
+            continue
+        index = faiss.read_index(os.path.join(directory, "faiss_index.bin"))
+        if not isinstance(index, faiss.IndexFlat):
+            raise ValueError(f"{directory} has no embeddings.npy and its {type(index).__name__} cannot return "
+                             "exact vectors; rebuild the store to compare compressions")
+        parts.append(index.reconstruct_n(0, index.ntotal))
+    return np.vstack(parts)
+
+def bench_compression(vector_store_dir, index_type, compressions):
+    """Size, latency and recall@10 of each compression versus a float32 flat index on the store's vectors."""
+    return compression_report(load_store_embeddings(vector_store_dir), index_type, compressions)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the RAG pipeline with fake backends.")
+    parser.add_argument("--queries", help="JSON-lines trace of queries (defaults to built-in sample questions)")
+    parser.add_argument("--vector-store-dir", default=os.path.join(ROOT_DIR, "rag_backup", "vector_store"))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per fake embedding call")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds per fake generation call")
+    parser.add_argument("--web-latency", type=float, default=0.2, help="Seconds per fake web search")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the embedding, answer and web caches")
+    parser.add_argument("--stream", action="store_true", help="Also benchmark /api/chat/stream")
+    parser.add_argument("--build-sizes", default="", help="Comma-separated corpus sizes for the index build benchmark")
+    parser.add_argument("--index-type", default="flat", help="Index type for the build benchmark")
+    parser.add_argument("--compression", default="",
+                        help=f"Comma-separated compressions ({', '.join(COMPRESSION_TYPES)}) to compare on the "
+                             "store's embeddings with --index-type, or 'all'")
+    parser.add_argument("--reranker", default=None, help="'cross-encoder', 'lexical' or 'none' (default: RERANKER)")
+    parser.add_argument("--rerank-candidates", default="10,50,100",
+                        help="Comma-separated candidate counts for the rerank latency benchmark")
+    return parser.parse_args()
+
+def run(args):
+    histories = load_queries(args.queries)
+    _, system = make_system(args)
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "vector_store_dir"},
+        "search_local_docs_ms": bench_retrieval(system, histories, repeat=3),
+        "rerank": bench_rerank(system, histories, [int(n) for n in args.rerank_candidates.split(",") if n], repeat=3),
+        "endpoints": [bench_endpoint_runs(args, histories, "/api/chat")],
+    }
+    if args.stream:
+        report["endpoints"].append(bench_endpoint_runs(args, histories, "/api/chat/stream"))
+    if args.build_sizes:
+        sizes = [int(size) for size in args.build_sizes.split(",") if size]
+        report["index_build"] = bench_build(sizes, args.embed_latency / 10, args.index_type)
+    if args.compression:
+        compressions = COMPRESSION_TYPES if args.compression == "all" else args.compression.split(",")
+        try:
+            report["compression"] = bench_compression(args.vector_store_dir, args.index_type, compressions)
+        except (OSError, ValueError) as e:
+            # Only this section needs the raw vectors; keep the rest of the report.
+            print(f"Skipping the compression benchmark: {e}")
+            report["compression"] = {"error": str(e)}
+    return report
+
+if __name__ == "__main__":
+    args = parse_args()
+    # The service and build_index log with print; keep stdout for the JSON report.
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+    print(json.dumps(report, indent=2))
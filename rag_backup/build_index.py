@@ -3,122 +3,456 @@
 
 import os
 import json
+import time
+import hashlib
+import argparse
+import textwrap
 import faiss
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import google.generativeai as genai
 from dotenv import load_dotenv
-from pathlib import Path
+
+from embedder import DEFAULT_EMBEDDING_MODEL, get_embedder, embed_in_batches
+from chunk_store import CHUNK_STORE_FILE, ChunkStore, ChunkStoreWriter
+from ingest import discover_files, iter_documents
+from filter_index import FILTER_INDEX_FILE, FilterIndex
+from lexical_index import LEXICAL_INDEX_FILE, LexicalIndex
+from vector_index import (INDEX_TYPES, COMPRESSION_TYPES, INDEX_PARAMS_FILE, create_index, validate_index_params,
+                          save_index_params, recall_report)
+from sharded_store import (SHARDS_FILE, SHARDS_DIR, SHARD_STRATEGIES, CURRENT_FILE, assign_shards,
+                           save_shards_manifest, resolve_store_dir, new_version_dir, publish_version, prune_versions)
 
 # Load environment variables
 dotenv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env")
 load_dotenv(dotenv_path=dotenv_path)
 
-def load_documents():
-    """Load documents from the corpus directory."""
-    corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
-    documents = []
-    
-    for file_path in Path(corpus_dir).glob("*.txt"):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            documents.append({
-                'source': file_path.name,
-                'text': content,
-                'chunks': []
-            })
-    
-    return documents
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS_DIR = os.path.join(BASE_DIR, "corpus")
+DEFAULT_VECTOR_STORE_DIR = os.path.join(BASE_DIR, "vector_store")
 
-def chunk_text(text, chunk_size=1000, overlap=200):
-    """Split text into overlapping chunks."""
-    chunks = []
-    start = 0
-    
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk.strip())
-        start = end - overlap
-        
-        if start >= len(text):
-            break
-    
-    return chunks
+def create_embeddings(texts, model_name=DEFAULT_EMBEDDING_MODEL, embedder=None, batch_size=None, max_workers=4):
+    """Create embeddings for the given texts in concurrent batches.
 
-def create_embeddings(texts, model_name="models/text-embedding-004"):
-    """Create embeddings for the given texts."""
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    if not gemini_api_key:
-        raise ValueError("GEMINI_API_KEY not found in environment variables")
-    
-    genai.configure(api_key=gemini_api_key)
-    
-    embeddings = []
-    for text in texts:
-        try:
-            result = genai.embed_content(model=model_name, content=text)
-            embeddings.append(result['embedding'])
-        except Exception as e:
-            print(f"Error creating embedding: {e}")
-            # Use zero vector as fallback
-            embeddings.append([0.0] * 768)  # Default embedding dimension
-    
-    return np.array(embeddings).astype('float32')
+    Failed batches are retried with backoff; if a batch still fails the build is
+    aborted rather than indexing placeholder vectors.
+    """
+    if embedder is None:
+        embedder = get_embedder(model_name=model_name)
 
-def build_index():
-    """Build the FAISS index and save chunks."""
-    print("Loading documents...")
-    documents = load_documents()
-    
-    if not documents:
+    return embed_in_batches(embedder, texts, batch_size=batch_size, max_workers=max_workers)
+
+def content_hash(text):
+    """Return the hex SHA-256 of a piece of text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def load_previous_build(vector_store_dir, model_name):
+    """Map chunk hash -> stored embedding from the last build made with `model_name`.
+
+    Returns an empty mapping and an empty file table when there is no usable
+    previous build (missing files, or embeddings from a different model).
+    """
+    manifest_path = os.path.join(vector_store_dir, "manifest.json")
+    embeddings_path = os.path.join(vector_store_dir, "embeddings.npy")
+    if not os.path.exists(manifest_path) or not os.path.exists(embeddings_path):
+        return {}, {}
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('embedding_model') != model_name:
+        print(f"Previous build used {manifest.get('embedding_model')}, re-embedding everything")
+        return {}, {}
+
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    vectors_by_hash = {}
+    row = 0
+    for entry in manifest['files'].values():
+        for chunk_hash in entry['chunks']:
+            vectors_by_hash[chunk_hash] = embeddings[row]
+            row += 1
+    return vectors_by_hash, manifest['files']
+
+class EmbeddingSpool:
+    """Collects embedding rows in corpus order and spools them to a raw float32 file.
+
+    Rows are either reused vectors or texts to embed. Texts are embedded a
+    window at a time (enough for every worker to send one full batch), so only
+    one window of texts and vectors is held in memory.
+    """
+
+    def __init__(self, path, embedder, batch_size=None, max_workers=4):
+        self.path = path
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.window = min(batch_size or embedder.max_batch_size, embedder.max_batch_size) * max_workers
+        self.count = 0
+        self.embedded = 0
+        self.embed_seconds = 0.0
+        self.dimension = None
+        self._rows = []
+        self._pending_texts = 0
+        self._file = open(path, 'wb')
+
+    def add_vector(self, vector):
+        self._rows.append(np.asarray(vector, dtype='float32'))
+
+    def add_text(self, text):
+        self._rows.append(text)
+        self._pending_texts += 1
+        if self._pending_texts >= self.window:
+            self.flush()
+
+    def flush(self):
+        texts = [row for row in self._rows if isinstance(row, str)]
+        if texts:
+            start_time = time.perf_counter()
+            vectors = iter(create_embeddings(texts, embedder=self.embedder, batch_size=self.batch_size,
+                                             max_workers=self.max_workers))
+            self.embed_seconds += time.perf_counter() - start_time
+            self.embedded += len(texts)
+            self._rows = [next(vectors) if isinstance(row, str) else row for row in self._rows]
+        if self._rows:
+            block = np.vstack(self._rows).astype('float32')
+            self.dimension = block.shape[1]
+            self._file.write(block.tobytes())
+            self.count += len(block)
+        self._rows = []
+        self._pending_texts = 0
+
+    def discard(self):
+        self._file.close()
+        os.remove(self.path)
+
+    def close(self):
+        """Flush and return the spooled rows as a read-only (count, dimension) memmap."""
+        self.flush()
+        self._file.close()
+        dimension = self.dimension or self.embedder.dimension
+        if not self.count:
+            return np.zeros((0, dimension), dtype='float32')
+        return np.memmap(self.path, dtype='float32', mode='r', shape=(self.count, dimension))
+
+def save_embeddings(path, embeddings, dtype='float32', block_rows=65536):
+    """Write `embeddings` to a .npy file block by block, replacing it atomically."""
+    tmp_path = path + ".tmp.npy"
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=embeddings.shape)
+    for start in range(0, len(embeddings), block_rows):
+        out[start:start + block_rows] = embeddings[start:start + block_rows]
+    out.flush()
+    del out
+    # Replaced rather than overwritten: the previous embeddings may still be memory-mapped.
+    os.replace(tmp_path, path)
+
+class _JsonArrayWriter:
+    """Writes legal_chunks.json one chunk at a time, in the layout json.dump(indent=2) produces."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self._count = 0
+
+    def add(self, item):
+        self._file.write("[\n" if not self._count else ",\n")
+        self._file.write(textwrap.indent(json.dumps(item, ensure_ascii=False, indent=2), "  "))
+        self._count += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write("\n]" if self._count else "[]")
+            self._file.close()
+
+def _staged_path(path):
+    """Temporary sibling of `path`; the extension is kept because np.savez appends .npz."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.tmp{ext}"
+
+def build_index(corpus_dir=DEFAULT_CORPUS_DIR, vector_store_dir=DEFAULT_VECTOR_STORE_DIR,
+                embedder=None, batch_size=None, max_workers=4, incremental=False,
+                index_type="flat", index_options=None, report=False, files=None, parse_workers=None,
+                previous_store_dir=None):
+    """Build the FAISS index and save chunks.
+
+    With `incremental=True` the manifest from the previous build is used to reuse
+    embeddings of chunks whose text has not changed; only new or edited chunks are
+    sent to the embedder, and chunks of deleted files are dropped from the index.
+
+    `index_type` selects the FAISS index (see vector_index.INDEX_TYPES) and
+    `index_options` overrides its build and query parameters, including the
+    vector `compression` (see vector_index.COMPRESSION_TYPES). With `report=True`
+    recall@k, latency and size are measured against an exact float32 flat index.
+
+    Documents (.txt, .pdf, .docx) anywhere under `corpus_dir`, subdirectories
+    included, are parsed and chunked on `parse_workers` processes and streamed
+    through embedding into the chunk store, so memory does not grow with the
+    corpus beyond the index itself. `files` restricts the build to those corpus
+    files (relative paths), as used for each shard by build_sharded_index. `previous_store_dir` is where an incremental build looks
+    for reusable embeddings when it differs from the output directory.
+
+    Every output file is written next to its destination and moved into place
+    only once the whole build has succeeded, so a failed build leaves the
+    previous store untouched.
+
+    Returns the number of chunks indexed.
+    """
+    if embedder is None:
+        embedder = get_embedder()
+    index_options = dict(index_options or {})
+    # Reject unbuildable options before any parsing or embedding is paid for.
+    validate_index_params(index_type, embedder.dimension, **index_options)
+
+    plain_build = files is None
+    if files is None:
+        files = discover_files(corpus_dir)
+    if not files:
         print("No documents found in corpus directory!")
-        return
-    
-    print(f"Found {len(documents)} documents")
-    
-    # Create chunks
-    all_chunks = []
-    for doc in documents:
-        chunks = chunk_text(doc['text'])
-        for i, chunk in enumerate(chunks):
-            all_chunks.append({
-                'source': doc['source'],
-                'text': chunk,
-                'chunk_id': i
-            })
-    
-    print(f"Created {len(all_chunks)} chunks")
-    
-    # Create embeddings
-    print("Creating embeddings...")
-    texts = [chunk['text'] for chunk in all_chunks]
-    embeddings = create_embeddings(texts)
-    
-    # Build FAISS index
-    print("Building FAISS index...")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
-    
-    # Save index and chunks
-    vector_store_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_store")
+        return 0
+    print(f"Found {len(files)} documents")
+
+    previous_vectors, previous_files = {}, {}
+    if incremental:
+        previous_vectors, previous_files = load_previous_build(previous_store_dir or vector_store_dir, embedder.model_name)
+
     os.makedirs(vector_store_dir, exist_ok=True)
-    
     index_path = os.path.join(vector_store_dir, "faiss_index.bin")
     chunks_path = os.path.join(vector_store_dir, "legal_chunks.json")
-    
-    faiss.write_index(index, index_path)
-    
-    with open(chunks_path, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, ensure_ascii=False, indent=2)
+    embeddings_path = os.path.join(vector_store_dir, "embeddings.npy")
+    manifest_path = os.path.join(vector_store_dir, "manifest.json")
+    chunk_store_path = os.path.join(vector_store_dir, CHUNK_STORE_FILE)
+    lexical_path = os.path.join(vector_store_dir, LEXICAL_INDEX_FILE)
+    filter_path = os.path.join(vector_store_dir, FILTER_INDEX_FILE)
+    params_path = os.path.join(vector_store_dir, INDEX_PARAMS_FILE)
+    # The manifest goes last: an incremental build trusts embeddings.npy only through it.
+    outputs = [chunk_store_path, chunks_path, lexical_path, filter_path, index_path, params_path,
+               embeddings_path, manifest_path]
+    staged = {path: _staged_path(path) for path in outputs}
+
+    spool = EmbeddingSpool(os.path.join(vector_store_dir, "embeddings.spool"), embedder,
+                           batch_size=batch_size, max_workers=max_workers)
+    json_writer = None
+    try:
+        # Parse, chunk and embed in one pass
+        print("Parsing documents and creating embeddings...")
+        manifest_files = {}
+        chunk_writer = ChunkStoreWriter(staged[chunk_store_path])
+        json_writer = _JsonArrayWriter(staged[chunks_path])
+        start_time = time.perf_counter()
+        for doc in iter_documents(corpus_dir, files, processes=parse_workers):
+            chunk_hashes = [content_hash(chunk) for chunk in doc['chunks']]
+            manifest_files[doc['source']] = {'sha256': doc['sha256'], 'chunks': chunk_hashes}
+            for i, (chunk, chunk_hash) in enumerate(zip(doc['chunks'], chunk_hashes)):
+                record = {'source': doc['source'], 'text': chunk, 'chunk_id': i, **doc['metadata']}
+                chunk_writer.add(record)
+                json_writer.add(record)
+                if chunk_hash in previous_vectors:
+                    spool.add_vector(previous_vectors[chunk_hash])
+                else:
+                    spool.add_text(chunk)
+        embeddings = spool.close()
+        num_chunks = chunk_writer.close()
+        json_writer.close()
+        elapsed = time.perf_counter() - start_time
+        print(f"Created {num_chunks} chunks from {len(manifest_files)} documents in {elapsed:.2f}s")
+
+        if incremental:
+            changed = [name for name, entry in manifest_files.items()
+                       if previous_files.get(name, {}).get('sha256') != entry['sha256']]
+            removed = [name for name in previous_files if name not in manifest_files]
+            print(f"Incremental build: {len(changed)} new/changed files, {len(removed)} removed files")
+
+        # Build FAISS index
+        print(f"Building FAISS index ({index_type})...")
+        dimension = embeddings.shape[1]
+        index, build_params = create_index(embeddings, index_type, **index_options)
+        faiss.write_index(index, staged[index_path])
+        build_params["index_bytes"] = os.path.getsize(staged[index_path])
+        save_index_params(vector_store_dir, build_params, os.path.basename(staged[params_path]))
+
+        print("Building lexical and filter indexes...")
+        chunk_store = ChunkStore(staged[chunk_store_path])
+        LexicalIndex.build(chunk_store.text(i) for i in range(len(chunk_store))).save(staged[lexical_path])
+        FilterIndex.build(chunk_store.metadata(i) for i in range(len(chunk_store))).save(staged[filter_path])
+        chunk_store.close()
+
+        # Kept for incremental rebuilds; a compressed store keeps them as float16 too,
+        # which changes reused vectors far less than the index encoding itself does.
+        save_embeddings(staged[embeddings_path], embeddings,
+                        dtype='float32' if build_params["compression"] == "none" else 'float16')
+
+        with open(staged[manifest_path], 'w', encoding='utf-8') as f:
+            json.dump({
+                'embedding_model': embedder.model_name,
+                'dimension': dimension,
+                'files': manifest_files
+            }, f, indent=2)
+    except BaseException:
+        if json_writer is not None:
+            json_writer.close()
+        spool.discard()
+        for path in staged.values():
+            for leftover in (path, path + ".tmp", path + ".tmp.npy"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        raise
+
+    # Replaced rather than overwritten: a running server may still have the previous files mapped.
+    for path in outputs:
+        os.replace(staged[path], path)
+
+    # A plain build replaces any sharded or versioned layout previously built into this directory.
+    for layout_file in (SHARDS_FILE, CURRENT_FILE):
+        if plain_build and os.path.exists(os.path.join(vector_store_dir, layout_file)):
+            os.remove(os.path.join(vector_store_dir, layout_file))
     
     print(f"Index saved to: {index_path}")
     print(f"Chunks saved to: {chunks_path}")
+    print(f"Embeddings reused: {num_chunks - spool.embedded}, recomputed: {spool.embedded}")
+    if spool.embedded:
+        print(f"Embedded {spool.embedded} chunks in {spool.embed_seconds:.2f}s "
+              f"({spool.embedded / max(spool.embed_seconds, 1e-9):.1f} chunks/sec)")
+    if report:
+        print(f"Recall/latency/size versus float32 flat index: {json.dumps(recall_report(index, np.asarray(embeddings)))}")
+    del embeddings
+    os.remove(spool.path)
     print("Vector store build completed successfully!")
+    return num_chunks
+
+def _build_shard(kwargs):
+    return kwargs["vector_store_dir"], build_index(**kwargs)
+
+def build_sharded_index(corpus_dir=DEFAULT_CORPUS_DIR, vector_store_dir=DEFAULT_VECTOR_STORE_DIR,
+                        num_shards=4, strategy="hash", processes=None, embedder=None, previous_store_dir=None,
+                        **build_options):
+    """Build a sharded vector store, one independent build_index run per shard.
+
+    Corpus files (including subdirectories) are assigned to shards by
+    sharded_store.assign_shards, and the shards are built in parallel worker
+    processes. Each shard directory is a complete store with its own manifest,
+    so `incremental=True` works per shard, reusing the same shard of
+    `previous_store_dir` when given. `embedder` must be picklable.
+
+    Returns the total number of chunks indexed.
+    """
+    if embedder is None:
+        embedder = get_embedder()
+    validate_index_params(build_options.get("index_type", "flat"), embedder.dimension,
+                          **(build_options.get("index_options") or {}))
+
+    relative_paths = discover_files(corpus_dir)
+    if not relative_paths:
+        print("No documents found in corpus directory!")
+        return 0
+    shard_files = assign_shards(relative_paths, strategy, num_shards)
+    print(f"Building {len(shard_files)} shards ({strategy}) from {len(relative_paths)} documents")
+
+    processes = processes or min(len(shard_files), os.cpu_count() or 1)
+    # Each shard build parses its documents on its own worker processes; split the cores.
+    build_options.setdefault("parse_workers", max(1, (os.cpu_count() or 1) // processes))
+    jobs = [dict(build_options, corpus_dir=corpus_dir, vector_store_dir=os.path.join(vector_store_dir, SHARDS_DIR, name),
+                 embedder=embedder, files=files,
+                 previous_store_dir=os.path.join(previous_store_dir, SHARDS_DIR, name) if previous_store_dir else None)
+            for name, files in shard_files.items()]
+    start_time = time.perf_counter()
+    total_chunks = 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for shard_dir, num_chunks in executor.map(_build_shard, jobs):
+            total_chunks += num_chunks
+            print(f"Shard built: {shard_dir}")
+
+    # Written last, so the service keeps loading the previous layout if a shard build fails.
+    save_shards_manifest(vector_store_dir, strategy, shard_files)
+    print(f"Built {len(jobs)} shards in {time.perf_counter() - start_time:.2f}s")
+    return total_chunks
+
+def build_versioned_index(vector_store_dir=DEFAULT_VECTOR_STORE_DIR, keep_versions=3, sharding=None, **build_options):
+    """Build into a new directory under versions/ and publish it by swapping CURRENT.
+
+    The live version is never written to, so a running service can keep serving
+    it and hot-reload the new one once CURRENT changes. `sharding` holds the
+    build_sharded_index arguments for a sharded build. Incremental builds reuse
+    embeddings from the live version. The newest `keep_versions` versions are kept.
+    """
+    live_dir, _ = resolve_store_dir(vector_store_dir)
+    target_dir, version = new_version_dir(vector_store_dir)
+    print(f"Building version {version}")
+
+    if sharding:
+        num_chunks = build_sharded_index(vector_store_dir=target_dir, previous_store_dir=live_dir, **sharding, **build_options)
+    else:
+        num_chunks = build_index(vector_store_dir=target_dir, previous_store_dir=live_dir, **build_options)
+    if not num_chunks:
+        print(f"Version {version} is empty; CURRENT left unchanged")
+        return None
+
+    publish_version(vector_store_dir, version)
+    print(f"Published version {version}")
+    removed = prune_versions(vector_store_dir, keep_versions)
+    if removed:
+        print(f"Removed old versions: {', '.join(removed)}")
+    return version
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the FAISS vector store from the legal corpus.")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--vector-store-dir", default=DEFAULT_VECTOR_STORE_DIR)
+    parser.add_argument("--embedder", default=None, help="'gemini' (default) or 'local' for an offline deterministic embedder")
+    parser.add_argument("--batch-size", type=int, default=None, help="Texts per embedding request")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent embedding requests")
+    parser.add_argument("--incremental", action="store_true", help="Only embed chunks that changed since the last build")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF: number of inverted lists")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF: lists visited per query")
+    parser.add_argument("--hnsw-m", type=int, default=None, help="HNSW: neighbours per node")
+    parser.add_argument("--ef-construction", type=int, default=None, help="HNSW: build-time search depth")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW: query-time search depth")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ: sub-quantizers (bytes) per vector")
+    parser.add_argument("--pq-nbits", type=int, default=None, help="PQ: bits per sub-quantizer code")
+    parser.add_argument("--compression", choices=COMPRESSION_TYPES, default="none",
+                        help="Vector encoding: float32 ('none'), float16, int8 scalar quantization or PQ")
+    parser.add_argument("--report", action="store_true", help="Report recall@k and latency against a flat index")
+    parser.add_argument("--shards", type=int, default=0, help="Build a sharded store with this many hash shards")
+    parser.add_argument("--shard-by", choices=SHARD_STRATEGIES, default=None,
+                        help="Shard assignment: 'hash' (needs --shards) or 'directory' (one shard per corpus subdirectory)")
+    parser.add_argument("--processes", type=int, default=None, help="Shards built in parallel (default: CPU count)")
+    parser.add_argument("--versioned", action="store_true",
+                        help="Build into versions/<timestamp> and publish it through CURRENT for hot reload")
+    parser.add_argument("--keep-versions", type=int, default=3, help="Versions kept by --versioned builds")
+    parser.add_argument("--parse-workers", type=int, default=None,
+                        help="Processes parsing PDF/DOCX/TXT files per build (default: CPU count)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
+    options = dict(
+        corpus_dir=args.corpus_dir,
+        vector_store_dir=args.vector_store_dir,
+        embedder=get_embedder(args.embedder),
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        incremental=args.incremental,
+        index_type=args.index_type,
+        index_options={
+            "nlist": args.nlist,
+            "nprobe": args.nprobe,
+            "m": args.hnsw_m,
+            "ef_construction": args.ef_construction,
+            "ef_search": args.ef_search,
+            "pq_m": args.pq_m,
+            "pq_nbits": args.pq_nbits,
+            "compression": args.compression,
+        },
+        report=args.report,
+        parse_workers=args.parse_workers,
+    )
+    sharding = None
+    if args.shards or args.shard_by:
+        sharding = {"num_shards": args.shards or 4, "strategy": args.shard_by or "hash", "processes": args.processes}
     try:
-        build_index()
+        if args.versioned:
+            build_versioned_index(keep_versions=args.keep_versions, sharding=sharding, **options)
+        elif sharding:
+            build_sharded_index(**sharding, **options)
+        else:
+            build_index(**options)
     except Exception as e:
         print(f"Error building index: {e}")
         import traceback
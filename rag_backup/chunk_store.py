@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# /rag_backup/chunk_store.py
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import shutil
+import tempfile
+import subprocess
+from array import array
+
+import numpy as np
+
+CHUNK_STORE_FILE = "legal_chunks.bin"
+MAGIC = b"LGLCHNK1"
+# magic, chunk count, text blob size, metadata blob size
+HEADER = struct.Struct("<8sQQQ")
+
+class ChunkStoreWriter:
+    """Writes chunks to the packed chunk store format one at a time.
+
+    Layout: header, text offsets (uint64[n + 1]), metadata offsets (uint64[n + 1]),
+    the UTF-8 text blob, then a blob of compact JSON metadata (every chunk field
+    except `text`). Blobs are spooled to temporary files, so memory use is only
+    the two offset tables.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._text_offsets = array('Q', [0])
+        self._meta_offsets = array('Q', [0])
+        directory = os.path.dirname(os.path.abspath(path))
+        self._text_blob = tempfile.TemporaryFile(dir=directory)
+        self._meta_blob = tempfile.TemporaryFile(dir=directory)
+
+    def add(self, chunk):
+        text = chunk.get('text', '').encode('utf-8')
+        meta = json.dumps({key: value for key, value in chunk.items() if key != 'text'},
+                          ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self._text_blob.write(text)
+        self._meta_blob.write(meta)
+        self._text_offsets.append(self._text_offsets[-1] + len(text))
+        self._meta_offsets.append(self._meta_offsets[-1] + len(meta))
+
+    def close(self):
+        count = len(self._text_offsets) - 1
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, count, self._text_offsets[-1], self._meta_offsets[-1]))
+            f.write(self._text_offsets.tobytes())
+            f.write(self._meta_offsets.tobytes())
+            for blob in (self._text_blob, self._meta_blob):
+                blob.seek(0)
+                shutil.copyfileobj(blob, f)
+                blob.close()
+        os.replace(tmp_path, self.path)
+        return count
+
+def write_chunk_store(path, chunks):
+    """Write an iterable of chunk dicts to `path`. Returns the number written."""
+    writer = ChunkStoreWriter(path)
+    for chunk in chunks:
+        writer.add(chunk)
+    return writer.close()
+
+class ChunkStore:
+    """Read-only, memory-mapped view of a packed chunk store.
+
+    Only the offset tables are touched at open time; a chunk's text and metadata
+    are decoded when it is indexed. Pages are mapped from the OS page cache, so
+    every worker process opening the same file shares one copy.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, text_size, meta_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk store file")
+
+        self._count = count
+        position = HEADER.size
+        self._text_offsets = np.frombuffer(self._mmap, dtype='<u8', count=count + 1, offset=position)
+        position += (count + 1) * 8
+        self._meta_offsets = np.frombuffer(self._mmap, dtype='<u8', count=count + 1, offset=position)
+        position += (count + 1) * 8
+        self._text_start = position
+        self._meta_start = position + text_size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("chunk index out of range")
+        chunk = self.metadata(i)
+        chunk['text'] = self.text(i)
+        return chunk
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def text(self, i):
+        start = self._text_start + int(self._text_offsets[i])
+        end = self._text_start + int(self._text_offsets[i + 1])
+        return self._mmap[start:end].decode('utf-8')
+
+    def metadata(self, i):
+        start = self._meta_start + int(self._meta_offsets[i])
+        end = self._meta_start + int(self._meta_offsets[i + 1])
+        return json.loads(self._mmap[start:end])
+
+    def close(self):
+        # Drop the numpy views first; the mmap cannot close while they export its buffer.
+        self._text_offsets = self._meta_offsets = None
+        self._mmap.close()
+        self._file.close()
+
+class ShardedChunks:
+    """Concatenation of the chunk lists of several shards, indexed globally."""
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        n = int(np.searchsorted(self.offsets, i, side='right')) - 1
+        return self.shards[n][i - int(self.offsets[n])]
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+def load_chunks(vector_store_dir):
+    """Open the packed chunk store if present, else fall back to legal_chunks.json."""
+    store_path = os.path.join(vector_store_dir, CHUNK_STORE_FILE)
+    if os.path.exists(store_path):
+        return ChunkStore(store_path)
+    with open(os.path.join(vector_store_dir, "legal_chunks.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def convert_json(json_path, store_path):
+    """Convert an existing legal_chunks.json into the packed format."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        chunks = json.load(f)
+    return write_chunk_store(store_path, chunks)
+
+_MEASURE_SCRIPT = """
+import sys, time, json, resource
+sys.path.insert(0, {module_dir!r})
+from chunk_store import ChunkStore
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+if {kind!r} == "json":
+    chunks = json.load(open({path!r}, 'r', encoding='utf-8'))
+else:
+    chunks = ChunkStore({path!r})
+load_ms = (time.perf_counter() - start) * 1000
+texts = [chunks[i]['text'] for i in range(min(5, len(chunks)))]
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"load_ms": round(load_ms, 2), "rss_delta_kb": after - before}}))
+"""
+
+def compare_formats(json_path, store_path):
+    """Measure load time and RSS growth of both formats, each in a fresh interpreter."""
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    report = {}
+    for kind, path in (("json", json_path), ("chunk_store", store_path)):
+        script = _MEASURE_SCRIPT.format(module_dir=module_dir, kind=kind, path=path)
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+        report[kind] = {**json.loads(output.stdout.strip().splitlines()[-1]), "file_bytes": os.path.getsize(path)}
+    return report
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("convert", "compare"):
+        print("Usage: chunk_store.py convert <legal_chunks.json> [<legal_chunks.bin>]")
+        print("       chunk_store.py compare <legal_chunks.json> <legal_chunks.bin>")
+        sys.exit(1)
+
+    json_path = sys.argv[2]
+    store_path = sys.argv[3] if len(sys.argv) > 3 else os.path.join(os.path.dirname(json_path), CHUNK_STORE_FILE)
+    if sys.argv[1] == "convert":
+        start = time.perf_counter()
+        count = convert_json(json_path, store_path)
+        print(f"Wrote {count} chunks to {store_path} in {time.perf_counter() - start:.2f}s")
+    else:
+        print(json.dumps(compare_formats(json_path, store_path), indent=2))
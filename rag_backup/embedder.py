@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# /rag_backup/embedder.py
+
+import os
+import re
+import time
+import random
+import hashlib
+import numpy as np
+import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_DIMENSION = 768
+
+class EmbeddingError(RuntimeError):
+    """Raised when a batch still fails after all retries."""
+
+class Embedder:
+    """Turns a list of texts into a float32 matrix of shape (len(texts), dimension)."""
+
+    model_name = None
+    dimension = EMBEDDING_DIMENSION
+    max_batch_size = 100
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+class GeminiEmbedder(Embedder):
+    """Embeds texts with the Gemini embedding API, many texts per request.
+
+    genai.configure sets process-wide state, so an embedder unpickled in a
+    spawned worker (e.g. a shard build) configures the client again there.
+    """
+
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, api_key=None):
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+
+        self.api_key = api_key
+        self.model_name = model_name
+        genai.configure(api_key=api_key)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        genai.configure(api_key=self.api_key)
+
+    def embed(self, texts):
+        result = genai.embed_content(model=self.model_name, content=list(texts))
+        return np.array(result['embedding']).astype('float32').reshape(len(texts), -1)
+
+class LocalEmbedder(Embedder):
+    """Deterministic, offline stand-in that hashes tokens into a fixed-size vector.
+
+    Texts sharing words end up close together, which is enough for exercising the
+    index build and search paths in tests and benchmarks without network access.
+    """
+
+    def __init__(self, dimension=EMBEDDING_DIMENSION, latency=0.0):
+        self.model_name = f"local-hash-{dimension}"
+        self.dimension = dimension
+        self.latency = latency
+
+    def embed(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+
+        vectors = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower()):
+                digest = hashlib.md5(token.encode('utf-8')).digest()
+                bucket = int.from_bytes(digest[:4], 'little') % self.dimension
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+            norm = np.linalg.norm(vectors[row])
+            if norm:
+                vectors[row] /= norm
+        return vectors
+
+def get_embedder(name=None, model_name=DEFAULT_EMBEDDING_MODEL):
+    """Return the embedder selected by `name` or the EMBEDDER environment variable."""
+    name = (name or os.getenv("EMBEDDER", "gemini")).lower()
+    if name == "gemini":
+        return GeminiEmbedder(model_name=model_name)
+    if name == "local":
+        return LocalEmbedder()
+    raise ValueError(f"Unknown embedder: {name}")
+
+def _embed_with_retry(embedder, texts, max_retries, backoff):
+    for attempt in range(max_retries + 1):
+        try:
+            return embedder.embed(texts)
+        except Exception as e:
+            if attempt == max_retries:
+                raise EmbeddingError(f"Embedding batch of {len(texts)} texts failed after {attempt + 1} attempts: {e}") from e
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            print(f"Embedding batch failed ({e}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+def embed_in_batches(embedder, texts, batch_size=None, max_workers=4, max_retries=5, backoff=1.0):
+    """Embed `texts` in batches on a bounded worker pool, preserving input order."""
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, embedder.dimension), dtype='float32')
+
+    batch_size = min(batch_size or embedder.max_batch_size, embedder.max_batch_size)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_embed_with_retry, embedder, batch, max_retries, backoff) for batch in batches]
+        results = [future.result() for future in futures]
+
+    return np.vstack(results).astype('float32')
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# /rag_backup/filter_index.py
+
+import os
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from vector_index import IdSelection
+
+FILTER_INDEX_FILE = "filter_index.npz"
+FILTER_FIELDS = ("source", "act", "year", "doc_type")
+
+def normalize_value(value):
+    return str(value).strip().casefold()
+
+class FilterIndex:
+    """Precomputed sorted chunk-id arrays for every value of each metadata field.
+
+    All id arrays are stored back to back in one int64 array, with `offsets`
+    marking where each (field, value) key starts, so loading is a single read.
+    """
+
+    def __init__(self, keys, offsets, ids, cache_size=256):
+        self.keys = [tuple(key) for key in keys]
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self.offsets = offsets
+        self.ids = ids
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, metadata):
+        """Build from an iterable of per-chunk metadata dicts, in chunk id order."""
+        postings = {}
+        for chunk_id, meta in enumerate(metadata):
+            for field in FILTER_FIELDS:
+                value = meta.get(field)
+                if value is not None and value != "":
+                    postings.setdefault((field, normalize_value(value)), []).append(chunk_id)
+        return cls.from_postings(postings)
+
+    @classmethod
+    def from_postings(cls, postings):
+        keys = sorted(postings)
+        offsets = np.zeros(len(keys) + 1, dtype='int64')
+        for i, key in enumerate(keys):
+            offsets[i + 1] = offsets[i] + len(postings[key])
+        ids = np.concatenate([np.asarray(postings[key], dtype='int64') for key in keys]) if keys else np.zeros(0, dtype='int64')
+        return cls(keys, offsets, ids)
+
+    @classmethod
+    def concatenate(cls, indexes, id_offsets):
+        """Merge per-shard indexes into one over global ids."""
+        postings = {}
+        for index, id_offset in zip(indexes, id_offsets):
+            for key in index.keys:
+                postings.setdefault(key, []).append(index._ids_for_key(key) + int(id_offset))
+        return cls.from_postings({key: np.concatenate(parts) for key, parts in postings.items()})
+
+    def save(self, path):
+        keys = np.frombuffer(json.dumps(self.keys).encode('utf-8'), dtype='uint8')
+        np.savez(path, keys=keys, offsets=self.offsets, ids=self.ids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(json.loads(data['keys'].tobytes().decode('utf-8')), data['offsets'], data['ids'])
+
+    def values(self):
+        """{field: [values]} available for filtering."""
+        result = {field: [] for field in FILTER_FIELDS}
+        for field, value in self.keys:
+            result.setdefault(field, []).append(value)
+        return result
+
+    def _ids_for_key(self, key):
+        position = self.positions.get(key)
+        if position is None:
+            return np.zeros(0, dtype='int64')
+        return self.ids[self.offsets[position]:self.offsets[position + 1]]
+
+    def select(self, filters):
+        """Return the IdSelection of chunks matching `filters`, or None when there are none.
+
+        `filters` maps a field to a value or a list of values. Values of one field
+        are alternatives (OR); different fields must all match (AND). Selections
+        are cached, so a repeated filter also reuses its FAISS selectors.
+        """
+        if not filters:
+            return None
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown filter field(s): {', '.join(sorted(unknown))}. Use {', '.join(FILTER_FIELDS)}")
+
+        normalized = []
+        for field in sorted(filters):
+            values = filters[field] if isinstance(filters[field], (list, tuple)) else [filters[field]]
+            if not values:
+                raise ValueError(f"Filter '{field}' has no values")
+            normalized.append((field, tuple(sorted(normalize_value(value) for value in values))))
+        cache_key = tuple(normalized)
+
+        with self._lock:
+            selection = self._cache.get(cache_key)
+            if selection is not None:
+                self._cache.move_to_end(cache_key)
+                return selection
+
+        ids = None
+        for field, values in normalized:
+            field_ids = np.unique(np.concatenate([self._ids_for_key((field, value)) for value in values]))
+            ids = field_ids if ids is None else np.intersect1d(ids, field_ids, assume_unique=True)
+        selection = IdSelection(ids)
+
+        with self._lock:
+            self._cache[cache_key] = selection
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return selection
+
+def load_filter_index(vector_store_dir, chunks=None):
+    """Load filter_index.npz; for older stores, build it from `chunks` if given."""
+    path = os.path.join(vector_store_dir, FILTER_INDEX_FILE)
+    if os.path.exists(path):
+        return FilterIndex.load(path)
+    if chunks is None:
+        return None
+    return FilterIndex.build(chunks.metadata(i) if hasattr(chunks, "metadata") else chunks[i]
+                             for i in range(len(chunks)))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# /rag_backup/ingest.py
+#
+# Streaming corpus ingestion: files are parsed and chunked in worker processes
+# and handed to the build one document at a time, with a bounded number of
+# documents in flight, so memory does not grow with the size of the corpus.
+
+import os
+import re
+import json
+import hashlib
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx")
+METADATA_SUFFIX = ".meta.json"
+YEAR_PATTERN = re.compile(r"(?<!\d)(1[89]\d{2}|20\d{2})(?!\d)")
+CASE_LAW_WORDS = frozenset(("case", "cases", "judgment", "judgments", "judgement", "judgements", "v", "vs"))
+
+def discover_files(corpus_dir, recursive=True):
+    """Sorted paths, relative to corpus_dir, of every supported file in it and (by default) its subdirectories."""
+    pattern = "**/*" if recursive else "*"
+    return sorted(str(path.relative_to(corpus_dir)) for path in Path(corpus_dir).glob(pattern)
+                  if path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS)
+
+def extract_text(path):
+    """Return the plain text of a .txt, .pdf or .docx file."""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".txt":
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    if suffix == ".pdf":
+        import fitz  # PyMuPDF
+        with fitz.open(path) as pdf:
+            return "\n".join(page.get_text() for page in pdf)
+    if suffix == ".docx":
+        import docx2txt
+        return docx2txt.process(path)
+    raise ValueError(f"Unsupported file type: {path}")
+
+def extract_metadata(relative_path):
+    """Guess act, year and doc_type from a corpus file name.
+
+    "consumer_protection_act_2019.txt" gives act "Consumer Protection Act",
+    year 2019 and doc_type "act". A sidecar file "<name>.meta.json" next to the
+    document overrides any of the guessed fields.
+    """
+    stem = Path(relative_path).stem
+    words = [word for word in re.split(r"[\W_]+", stem.lower()) if word]
+    year_match = YEAR_PATTERN.search(stem)
+    metadata = {"act": None, "year": int(year_match.group(1)) if year_match else None, "doc_type": "other"}
+
+    if "constitution" in words:
+        metadata.update(doc_type="constitution", act="Constitution of India")
+    elif "act" in words or "code" in words:
+        # "..._act_2019" ends the name at "act"; codes are named by the whole stem.
+        name = words[:words.index("act") + 1] if "act" in words else [word for word in words if not word.isdigit()]
+        metadata.update(doc_type="act", act=" ".join(_title(word, i) for i, word in enumerate(name)))
+    elif CASE_LAW_WORDS & set(words):
+        metadata["doc_type"] = "case_law"
+    return metadata
+
+def _title(word, position):
+    return word if position and word in ("of", "the", "and", "for", "on", "in", "to") else word.capitalize()
+
+def _read_sidecar(path):
+    sidecar = path + METADATA_SUFFIX
+    if not os.path.exists(sidecar):
+        return {}
+    with open(sidecar, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def chunk_text(text, chunk_size=1000, overlap=200):
+    """Split text into overlapping chunks."""
+    chunks = []
+    start = 0
+
+    while start < len(text):
+        end = start + chunk_size
+        chunk = text[start:end]
+        chunks.append(chunk.strip())
+        start = end - overlap
+
+        if start >= len(text):
+            break
+
+    return chunks
+
+def parse_document(corpus_dir, relative_path, chunk_size=1000, overlap=200):
+    """Parse and chunk one file. Runs in a worker process.
+
+    The document's 'source' is its path relative to corpus_dir ("bombay/notes.txt"),
+    so files of the same name in different folders stay distinct.
+    """
+    path = os.path.join(corpus_dir, relative_path)
+    source = Path(relative_path).as_posix()
+    try:
+        text = extract_text(path)
+        metadata = dict(extract_metadata(relative_path), **_read_sidecar(path))
+    except Exception as e:
+        return {'source': source, 'error': f"{relative_path}: {e}"}
+    return {
+        'source': source,
+        'sha256': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+        'metadata': metadata,
+        'chunks': chunk_text(text, chunk_size, overlap),
+    }
+
+def iter_documents(corpus_dir, files=None, processes=None, max_in_flight=None, chunk_size=1000, overlap=200):
+    """Yield parsed documents ({'source', 'sha256', 'metadata', 'chunks'}) in file order.
+
+    Parsing runs on `processes` worker processes; at most `max_in_flight`
+    documents (default: twice the worker count) are parsed ahead of the consumer.
+    Files that cannot be parsed are reported and skipped.
+    """
+    if files is None:
+        files = discover_files(corpus_dir)
+    processes = processes or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * processes
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = deque()
+        remaining = iter(files)
+        for relative_path in remaining:
+            pending.append(executor.submit(parse_document, corpus_dir, relative_path, chunk_size, overlap))
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            document = pending.popleft().result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append(executor.submit(parse_document, corpus_dir, next_path, chunk_size, overlap))
+            if 'error' in document:
+                print(f"Skipping unreadable document {document['error']}")
+                continue
+            yield document
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# /rag_backup/lexical_index.py
+
+import os
+import re
+import math
+from collections import Counter
+
+import numpy as np
+
+LEXICAL_INDEX_FILE = "lexical_index.npz"
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in into is it its me my "
+    "of on or our so that the their there this to under was what when where which who why will with you your".split()
+)
+# "Article 21", "Art. 21A", "Section 35", "Sec. 2(7)" ... are kept as single tokens
+# such as "article_21" so that exact citations are matched as a unit.
+CITATION_PATTERN = re.compile(
+    r"\b(article|art|section|sec|rule|order|clause|schedule)\.?\s*(\d+[a-z]?(?:\(\d+\))?)", re.IGNORECASE
+)
+CITATION_ALIASES = {"art": "article", "sec": "section"}
+WORD_PATTERN = re.compile(r"\w+")
+
+def citation_tokens(text: str):
+    tokens = []
+    for kind, number in CITATION_PATTERN.findall(text):
+        kind = CITATION_ALIASES.get(kind.lower(), kind.lower())
+        tokens.append(f"{kind}_{number.lower()}")
+    return tokens
+
+def tokenize(text: str):
+    """Lower-cased content words plus one combined token per statutory citation."""
+    words = [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+    return words + citation_tokens(text)
+
+def citation_share(query: str):
+    """Fraction of the query's content that is citations, between 0 and 1."""
+    citations = citation_tokens(query)
+    if not citations:
+        return 0.0
+    remainder = CITATION_PATTERN.sub(" ", query.lower())
+    words = [word for word in WORD_PATTERN.findall(remainder) if word not in STOPWORDS]
+    return len(citations) / (len(citations) + len(words))
+
+class LexicalIndex:
+    """BM25 over an inverted index held in flat numpy arrays.
+
+    Postings for term t are docs[offsets[t]:offsets[t + 1]] with matching term
+    frequencies in tfs, so the whole index is five arrays plus the vocabulary.
+    """
+
+    def __init__(self, vocabulary, offsets, docs, tfs, doc_lengths, k1=1.2, b=0.75):
+        self.term_ids = {term: i for i, term in enumerate(vocabulary)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.num_docs = len(doc_lengths)
+        self.avg_doc_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, texts):
+        postings = {}
+        doc_lengths = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        vocabulary = sorted(postings)
+        offsets = np.zeros(len(vocabulary) + 1, dtype='int64')
+        docs, tfs = [], []
+        for i, term in enumerate(vocabulary):
+            entries = postings[term]
+            offsets[i + 1] = offsets[i] + len(entries)
+            docs.extend(doc_id for doc_id, _ in entries)
+            tfs.extend(min(tf, 65535) for _, tf in entries)
+
+        return cls(vocabulary, offsets, np.array(docs, dtype='int32'), np.array(tfs, dtype='uint16'),
+                   np.array(doc_lengths, dtype='int32'))
+
+    def save(self, path):
+        vocabulary = sorted(self.term_ids, key=self.term_ids.get)
+        blob = np.frombuffer("\n".join(vocabulary).encode('utf-8'), dtype='uint8')
+        np.savez(path, vocabulary=blob, offsets=self.offsets, docs=self.docs, tfs=self.tfs,
+                 doc_lengths=self.doc_lengths)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            text = data['vocabulary'].tobytes().decode('utf-8')
+            vocabulary = text.split("\n") if text else []
+            return cls(vocabulary, data['offsets'], data['docs'], data['tfs'], data['doc_lengths'])
+
+    def search(self, query: str, top_k: int = 5, ids=None):
+        """Return [(doc_id, score)] for the best BM25 matches, best first.
+
+        `ids` (sorted doc ids) restricts the results to those documents.
+        """
+        scores = np.zeros(self.num_docs, dtype='float32')
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.docs[start:end]
+            tfs = self.tfs[start:end].astype('float32')
+            idf = math.log(1 + (self.num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self.avg_doc_length)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+        matched = np.flatnonzero(scores)
+        if ids is not None:
+            matched = np.intersect1d(matched, ids, assume_unique=True)
+        if not len(matched):
+            return []
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in matched]
+
+class ShardedLexicalIndex:
+    """BM25 over several shard indexes, with doc ids offset by shard.
+
+    Each shard scores with its own document frequencies, so scores are only
+    approximately comparable across shards; with hash-assigned shards of similar
+    size the difference is small.
+    """
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+        self.offsets = np.cumsum([0] + [shard.num_docs for shard in self.shards])
+        self.num_docs = int(self.offsets[-1])
+
+    def search(self, query: str, top_k: int = 5, ids=None):
+        results = []
+        bounds = np.searchsorted(ids, self.offsets) if ids is not None else None
+        for n, (offset, shard) in enumerate(zip(self.offsets, self.shards)):
+            shard_ids = None if ids is None else ids[bounds[n]:bounds[n + 1]] - offset
+            if shard_ids is not None and not len(shard_ids):
+                continue
+            results.extend((int(offset) + doc_id, score) for doc_id, score in shard.search(query, top_k, shard_ids))
+        results.sort(key=lambda result: result[1], reverse=True)
+        return results[:top_k]
+
+def load_lexical_index(vector_store_dir):
+    path = os.path.join(vector_store_dir, LEXICAL_INDEX_FILE)
+    return LexicalIndex.load(path) if os.path.exists(path) else None
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several best-first lists of doc ids into one list of (doc_id, score), best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# /rag_backup/sharded_store.py
+#
+# Vector store layouts. A plain store is one directory holding faiss_index.bin,
+# the chunk store and the lexical index. A sharded store holds shards.json and
+# one such directory per shard under shards/; the service opens every shard and
+# searches them as one (vector_index.ShardedIndex). A versioned store keeps
+# complete plain or sharded stores under versions/ and names the live one in
+# CURRENT, which is replaced atomically to publish a new build.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+
+from chunk_store import CHUNK_STORE_FILE, ShardedChunks, load_chunks
+from lexical_index import ShardedLexicalIndex, load_lexical_index
+from vector_index import ShardedIndex, load_index_params
+from filter_index import FilterIndex, load_filter_index
+
+SHARDS_FILE = "shards.json"
+SHARDS_DIR = "shards"
+SHARD_STRATEGIES = ("hash", "directory")
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+def shard_for_file(relative_path, num_shards):
+    """Stable shard number for a corpus file, so rebuilds keep files in place."""
+    digest = hashlib.sha256(relative_path.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little') % num_shards
+
+def assign_shards(relative_paths, strategy="hash", num_shards=4):
+    """Group corpus files into {shard_name: [relative_path]}.
+
+    'hash' spreads files over `num_shards` shards by a hash of their path;
+    'directory' makes one shard per corpus subdirectory (e.g. one per court),
+    with top-level files in a shard named 'root'.
+    """
+    if strategy not in SHARD_STRATEGIES:
+        raise ValueError(f"Unknown shard strategy: {strategy}. Choose from {', '.join(SHARD_STRATEGIES)}")
+
+    shards = {}
+    for path in sorted(relative_paths):
+        if strategy == "hash":
+            name = f"shard_{shard_for_file(path, num_shards):03d}"
+        else:
+            name = os.path.dirname(path).replace(os.sep, "__") or "root"
+        shards.setdefault(name, []).append(path)
+    return dict(sorted(shards.items()))
+
+def save_shards_manifest(vector_store_dir, strategy, shard_files):
+    manifest = {
+        "strategy": strategy,
+        "shards": [{"name": name, "path": os.path.join(SHARDS_DIR, name), "files": len(files)}
+                   for name, files in shard_files.items()],
+    }
+    with open(os.path.join(vector_store_dir, SHARDS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+def load_shards_manifest(vector_store_dir):
+    """Return the parsed shards.json, or None for a plain (unsharded) store."""
+    path = os.path.join(vector_store_dir, SHARDS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def resolve_store_dir(vector_store_dir):
+    """Return (directory, version) of the live store; version is None when unversioned."""
+    current_path = os.path.join(vector_store_dir, CURRENT_FILE)
+    if not os.path.exists(current_path):
+        return vector_store_dir, None
+    with open(current_path, 'r', encoding='utf-8') as f:
+        version = f.read().strip()
+    return os.path.join(vector_store_dir, VERSIONS_DIR, version), version
+
+def new_version_dir(vector_store_dir):
+    """Return (directory, version) for a new, not yet published, build."""
+    version = time.strftime("%Y%m%d-%H%M%S")
+    directory = os.path.join(vector_store_dir, VERSIONS_DIR, version)
+    suffix = 1
+    while os.path.exists(directory):
+        suffix += 1
+        directory = os.path.join(vector_store_dir, VERSIONS_DIR, f"{version}-{suffix}")
+    return directory, os.path.basename(directory)
+
+def publish_version(vector_store_dir, version):
+    """Point CURRENT at `version`. Readers see either the old or the new name, never a partial write."""
+    tmp_path = os.path.join(vector_store_dir, CURRENT_FILE + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(vector_store_dir, CURRENT_FILE))
+
+def prune_versions(vector_store_dir, keep=3):
+    """Delete all but the newest `keep` versions, never the current one."""
+    versions_dir = os.path.join(vector_store_dir, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    _, current = resolve_store_dir(vector_store_dir)
+    # Version names are timestamps, so name order is build order.
+    versions = sorted(os.listdir(versions_dir))
+    removed = [name for name in versions[:-keep] if name != current] if keep > 0 else []
+    for name in removed:
+        shutil.rmtree(os.path.join(versions_dir, name))
+    return removed
+
+class VectorStore:
+    """The index, its parameters, chunks, lexical and filter indexes of a store directory."""
+
+    def __init__(self, index, index_params, chunks, lexical_index, filter_index, num_shards=1,
+                 path=None, version=None):
+        self.index = index
+        self.index_params = index_params
+        self.chunks = chunks
+        self.lexical_index = lexical_index
+        self.filter_index = filter_index
+        self.num_shards = num_shards
+        self.path = path
+        self.version = version
+        self.loaded_at = time.time()
+
+def _check_store_dir(store_dir):
+    index_path = os.path.join(store_dir, "faiss_index.bin")
+    chunks_present = (os.path.exists(os.path.join(store_dir, "legal_chunks.json"))
+                      or os.path.exists(os.path.join(store_dir, CHUNK_STORE_FILE)))
+    if not os.path.exists(index_path) or not chunks_present:
+        raise FileNotFoundError(f"Vector store not found in {store_dir}. Please run 'build_index.py'.")
+    return index_path
+
+def load_vector_store(vector_store_dir, search_workers=None):
+    """Open the live plain or sharded store in `vector_store_dir`, following CURRENT if present.
+
+    Shards are searched concurrently on a pool of `search_workers` threads
+    (default: one per shard). Index parameters are taken from the first shard.
+    """
+    vector_store_dir, version = resolve_store_dir(vector_store_dir)
+    manifest = load_shards_manifest(vector_store_dir)
+    if manifest is None:
+        index = faiss.read_index(_check_store_dir(vector_store_dir))
+        chunks = load_chunks(vector_store_dir)
+        return VectorStore(index, load_index_params(vector_store_dir), chunks,
+                           load_lexical_index(vector_store_dir), load_filter_index(vector_store_dir, chunks),
+                           path=vector_store_dir, version=version)
+
+    shard_dirs = [os.path.join(vector_store_dir, shard["path"]) for shard in manifest["shards"]]
+    if not shard_dirs:
+        raise FileNotFoundError(f"Sharded vector store in {vector_store_dir} has no shards.")
+    indexes = [faiss.read_index(_check_store_dir(shard_dir)) for shard_dir in shard_dirs]
+    executor = ThreadPoolExecutor(max_workers=search_workers or len(shard_dirs), thread_name_prefix="shard-search")
+    lexical_indexes = [load_lexical_index(shard_dir) for shard_dir in shard_dirs]
+    shard_chunks = [load_chunks(shard_dir) for shard_dir in shard_dirs]
+    chunks = ShardedChunks(shard_chunks)
+    filter_index = FilterIndex.concatenate(
+        [load_filter_index(shard_dir, shard) for shard_dir, shard in zip(shard_dirs, shard_chunks)], chunks.offsets)
+
+    print(f"Loaded {len(shard_dirs)} shards ({manifest.get('strategy')}) from {vector_store_dir}")
+    return VectorStore(
+        ShardedIndex(indexes, executor=executor),
+        load_index_params(shard_dirs[0]),
+        chunks,
+        ShardedLexicalIndex(lexical_indexes) if all(index is not None for index in lexical_indexes) else None,
+        filter_index,
+        num_shards=len(shard_dirs),
+        path=vector_store_dir,
+        version=version,
+    )
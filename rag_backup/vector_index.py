@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# /rag_backup/vector_index.py
+
+import os
+import json
+import time
+import threading
+import faiss
+import numpy as np
+
+INDEX_PARAMS_FILE = "index_params.json"
+
+# Build and query defaults per index type. Anything not given on the command line
+# falls back to these values.
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "hnsw": {"m": 32, "ef_construction": 200, "ef_search": 64},
+    "ivf_flat": {"nlist": 1024, "nprobe": 16},
+    "ivf_pq": {"nlist": 1024, "nprobe": 16, "pq_m": 64, "pq_nbits": 8},
+}
+INDEX_TYPES = tuple(DEFAULT_INDEX_PARAMS)
+
+# How the flat, hnsw and ivf_flat indexes store vectors: 'none' keeps float32,
+# 'fp16' halves the size, 'int8' (scalar quantization) quarters it and 'pq'
+# keeps pq_m codes of pq_nbits bits per vector. ivf_pq always uses 'pq'.
+COMPRESSION_TYPES = ("none", "fp16", "int8", "pq")
+COMPRESSION_CODES = {"none": "Flat", "fp16": "SQfp16", "int8": "SQ8"}
+DEFAULT_PQ_PARAMS = {"pq_m": 64, "pq_nbits": 8}
+
+def validate_index_params(index_type, dimension, compression="none", **overrides):
+    """Merge overrides into the defaults, raising ValueError for options that cannot be built.
+
+    Needs only the embedding dimension, so builds can check their options
+    before parsing or embedding anything.
+    """
+    if index_type not in DEFAULT_INDEX_PARAMS:
+        raise ValueError(f"Unknown index type: {index_type}. Choose from {', '.join(INDEX_TYPES)}")
+    compression = compression or "none"
+    if compression not in COMPRESSION_TYPES:
+        raise ValueError(f"Unknown compression: {compression}. Choose from {', '.join(COMPRESSION_TYPES)}")
+    if index_type == "ivf_pq" and compression not in ("none", "pq"):
+        raise ValueError(f"ivf_pq already stores PQ codes; use ivf_flat for {compression} compression")
+
+    params = dict(DEFAULT_INDEX_PARAMS[index_type])
+    if compression == "pq":
+        params.update((key, value) for key, value in DEFAULT_PQ_PARAMS.items() if key not in params)
+    params.update({key: value for key, value in overrides.items() if value is not None and key in params})
+    if "pq_m" in params and dimension % params["pq_m"]:
+        raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {dimension}")
+    params["compression"] = "pq" if index_type == "ivf_pq" else compression
+    return params
+
+def resolve_index_params(index_type, num_vectors, dimension, compression="none", **overrides):
+    """Merge overrides into the defaults and shrink them to fit small corpora."""
+    params = validate_index_params(index_type, dimension, compression, **overrides)
+
+    if "nlist" in params:
+        # FAISS wants roughly 39 training points per centroid.
+        nlist = max(1, min(params["nlist"], num_vectors // 39))
+        if nlist != params["nlist"]:
+            print(f"Reducing nlist from {params['nlist']} to {nlist} for {num_vectors} vectors")
+        params["nlist"] = nlist
+        params["nprobe"] = min(params["nprobe"], nlist)
+
+    if "pq_m" in params:
+        nbits = min(params["pq_nbits"], max(1, int(np.log2(max(num_vectors, 2)))))
+        if nbits != params["pq_nbits"]:
+            print(f"Reducing pq_nbits from {params['pq_nbits']} to {nbits} for {num_vectors} vectors")
+        params["pq_nbits"] = nbits
+
+    return params
+
+def factory_string(index_type, params):
+    compression = params.get("compression", "none")
+    code = COMPRESSION_CODES.get(compression) or f"PQ{params.get('pq_m')}x{params.get('pq_nbits')}"
+    if index_type == "flat":
+        # IndexPQ cannot take an ID selector (filtered search); an IVF with a
+        # single list scans the same PQ codes and can.
+        return f"IVF1,{code}" if compression == "pq" else code
+    if index_type == "hnsw":
+        return f"HNSW{params['m']}" if compression == "none" else f"HNSW{params['m']}_{code}"
+    if index_type == "ivf_flat":
+        return f"IVF{params['nlist']},{code}"
+    if index_type == "ivf_pq":
+        return f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    raise ValueError(f"Unknown index type: {index_type}")
+
+def create_index(embeddings, index_type="flat", train_sample=100000, compression="none", **overrides):
+    """Build a FAISS index of the requested type over `embeddings`.
+
+    Returns the index and the build parameters to persist next to it. Trained
+    index types (including every compressed one) are trained on a random sample
+    of at most `train_sample` vectors.
+    """
+    num_vectors, dimension = embeddings.shape
+    params = resolve_index_params(index_type, num_vectors, dimension, compression, **overrides)
+    description = factory_string(index_type, params)
+    index = faiss.index_factory(dimension, description, faiss.METRIC_L2)
+
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = params["ef_construction"]
+
+    if not index.is_trained:
+        sample = embeddings
+        if num_vectors > train_sample:
+            rows = np.random.default_rng(0).choice(num_vectors, train_sample, replace=False)
+            sample = embeddings[np.sort(rows)]
+        print(f"Training {description} index on {len(sample)} vectors...")
+        index.train(sample)
+
+    index.add(embeddings)
+    apply_search_params(index, params)
+
+    build_params = {"index_type": index_type, "factory": description, "dimension": dimension,
+                    "num_vectors": num_vectors, **params}
+    return index, build_params
+
+class IdSelection:
+    """Sorted int64 row ids to restrict searches to, with their FAISS selector built once.
+
+    IDSelectorBatch copies every id into a hash set when it is constructed,
+    which for a broad filter costs more than the search itself. The selector
+    is built on first use and kept, as are the per-shard selections, so a
+    selection cached by FilterIndex.select is only ever converted once.
+    """
+
+    def __init__(self, ids):
+        self.ids = np.asarray(ids, dtype='int64')
+        self._selector = None
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def selector(self):
+        with self._lock:
+            if self._selector is None:
+                self._selector = faiss.IDSelectorBatch(self.ids)
+            return self._selector
+
+    def shard(self, start, stop):
+        """The selection of rows [start, stop), renumbered from 0 (one shard's ids)."""
+        with self._lock:
+            selection = self._shards.get((start, stop))
+            if selection is None:
+                lo, hi = np.searchsorted(self.ids, [start, stop])
+                selection = self._shards[(start, stop)] = IdSelection(self.ids[lo:hi] - start)
+            return selection
+
+def search_parameters(index, params, ids=None):
+    """Return per-call faiss SearchParameters for `params`, or None if nothing applies.
+
+    Using per-call parameters instead of mutating the index keeps concurrent
+    searches with different knobs from interfering with each other. With `ids`
+    (an IdSelection) the search only considers those rows.
+    """
+    selector = ids.selector if ids is not None else None
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and (params.get("nprobe") or selector is not None):
+        return faiss.SearchParametersIVF(nprobe=int(params.get("nprobe") or ivf.nprobe), sel=selector)
+    if hasattr(index, "hnsw") and (params.get("ef_search") or selector is not None):
+        return faiss.SearchParametersHNSW(efSearch=int(params.get("ef_search") or index.hnsw.efSearch), sel=selector)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+def search_index(index, queries, k, params=None, ids=None):
+    """Search a FAISS or sharded index with optional knobs, restricted to `ids` if given.
+
+    `ids` is an IdSelection, or sorted row ids for a one-off selection.
+    """
+    if ids is not None and not isinstance(ids, IdSelection):
+        ids = IdSelection(ids)
+    if isinstance(index, ShardedIndex):
+        return index.search(queries, k, params=params, ids=ids)
+    return index.search(queries, k, params=search_parameters(index, params or {}, ids))
+
+def apply_search_params(index, params):
+    """Set the query-time knobs in `params` as the index's own defaults."""
+    if isinstance(index, ShardedIndex):
+        for shard in index.shards:
+            apply_search_params(shard, params)
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and params.get("nprobe"):
+        ivf.nprobe = int(params["nprobe"])
+    if hasattr(index, "hnsw") and params.get("ef_search"):
+        index.hnsw.efSearch = int(params["ef_search"])
+
+class ShardedIndex:
+    """Several FAISS indexes searched as one, with ids offset by shard.
+
+    Row ids of shard n start at the total size of shards 0..n-1, matching the
+    order chunks are concatenated in. search() runs the shards concurrently on
+    `executor` (FAISS releases the GIL while searching) and merges the per-shard
+    top-k by distance.
+    """
+
+    def __init__(self, shards, executor=None):
+        self.shards = list(shards)
+        self.offsets = np.cumsum([0] + [shard.ntotal for shard in self.shards])
+        self.ntotal = int(self.offsets[-1])
+        self.d = self.shards[0].d
+        self.executor = executor
+
+    def search(self, x, k, params=None, ids=None):
+        """Like faiss Index.search; `params` are query knobs, `ids` an IdSelection of global row ids."""
+        shard_ids = [None] * len(self.shards)
+        if ids is not None:
+            shard_ids = [ids.shard(int(self.offsets[n]), int(self.offsets[n + 1])) for n in range(len(self.shards))]
+        active = [n for n in range(len(self.shards)) if shard_ids[n] is None or len(shard_ids[n])]
+        if not active:
+            return np.full((len(x), k), np.inf, dtype='float32'), np.full((len(x), k), -1, dtype='int64')
+
+        def search_shard(n):
+            shard_params = search_parameters(self.shards[n], params or {}, shard_ids[n])
+            distances, ids = self.shards[n].search(x, k, params=shard_params)
+            return distances, np.where(ids >= 0, ids + self.offsets[n], -1)
+
+        if self.executor is not None and len(active) > 1:
+            results = list(self.executor.map(search_shard, active))
+        else:
+            results = [search_shard(n) for n in active]
+
+        distances = np.hstack([result[0] for result in results])
+        ids = np.hstack([result[1] for result in results])
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+def save_index_params(vector_store_dir, build_params, filename=INDEX_PARAMS_FILE):
+    with open(os.path.join(vector_store_dir, filename), 'w', encoding='utf-8') as f:
+        json.dump(build_params, f, indent=2)
+
+def load_index_params(vector_store_dir):
+    """Return the saved build parameters, or flat-index defaults for older stores."""
+    path = os.path.join(vector_store_dir, INDEX_PARAMS_FILE)
+    if not os.path.exists(path):
+        return {"index_type": "flat"}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def index_size(index):
+    """Serialized size of a FAISS index in bytes, as written by faiss.write_index."""
+    return int(faiss.serialize_index(index).size)
+
+def recall_report(index, embeddings, k=10, num_queries=200, noise=0.01):
+    """Compare `index` against an exact float32 flat index over the same vectors.
+
+    Queries are stored vectors with a little Gaussian noise, so the exact
+    neighbours are known. Returns recall@k, mean per-query latency and the
+    serialized size of both.
+    """
+    rng = np.random.default_rng(0)
+    num_queries = min(num_queries, len(embeddings))
+    rows = rng.choice(len(embeddings), num_queries, replace=False)
+    queries = embeddings[rows] + rng.normal(0, noise, (num_queries, embeddings.shape[1])).astype('float32')
+    k = min(k, len(embeddings))
+
+    flat = faiss.IndexFlatL2(embeddings.shape[1])
+    flat.add(embeddings)
+
+    def timed_search(target):
+        results = []
+        start = time.perf_counter()
+        for query in queries:
+            results.append(target.search(query.reshape(1, -1), k)[1][0])
+        return np.array(results), (time.perf_counter() - start) / num_queries * 1000
+
+    exact, flat_ms = timed_search(flat)
+    approx, index_ms = timed_search(index)
+    hits = sum(len(set(a[a >= 0]) & set(e)) for a, e in zip(approx, exact))
+    flat_bytes, index_bytes = index_size(flat), index_size(index)
+
+    return {
+        "k": k,
+        "queries": num_queries,
+        f"recall@{k}": round(hits / (num_queries * k), 4),
+        "flat_ms_per_query": round(flat_ms, 4),
+        "index_ms_per_query": round(index_ms, 4),
+        "speedup": round(flat_ms / index_ms, 2) if index_ms else None,
+        "flat_bytes": flat_bytes,
+        "index_bytes": index_bytes,
+        "size_ratio": round(index_bytes / flat_bytes, 4) if flat_bytes else None,
+    }
+
+def compression_report(embeddings, index_type="flat", compressions=COMPRESSION_TYPES, k=10, **overrides):
+    """recall_report for `index_type` built with each of `compressions` over the same vectors."""
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    results = []
+    for compression in compressions:
+        index, build_params = create_index(embeddings, index_type, compression=compression, **overrides)
+        results.append({"index_type": index_type, "compression": compression, "factory": build_params["factory"],
+                        **recall_report(index, embeddings, k=k)})
+    return results
@@ -14,10 +14,14 @@ cleanup() {
 # Set trap to cleanup on script exit
 trap cleanup SIGINT SIGTERM
 
-# Start Python RAG Service
+# Start Python RAG Service (RAG_SERVER=gunicorn for the multi-worker production server)
 echo "Starting Python RAG Service on port 5001..."
 cd backend
-python3 rag_service.py &
+if [ "$RAG_SERVER" = "gunicorn" ]; then
+    gunicorn -c gunicorn.conf.py rag_service:app &
+else
+    python3 rag_service.py &
+fi
 PYTHON_PID=$!
 
 # Wait a moment for Python service to start
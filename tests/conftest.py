@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# /tests/conftest.py
+#
+# Everything here runs offline: builds use LocalEmbedder, and the service gets
+# the fake model and stub web search that bench_rag.py uses.
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "backend"))
+sys.path.append(os.path.join(ROOT_DIR, "rag_backup"))
+
+# rag_service builds its default RAGSystem at import time; keep that offline too.
+os.environ.setdefault("EMBEDDER", "local")
+os.environ.setdefault("WEB_SEARCH_BACKEND", "stub")
+os.environ.setdefault("RERANKER", "none")
+
+from embedder import LocalEmbedder
+from build_index import build_index
+
+CORPUS = {
+    "consumer_protection_act_2019.txt": "The Consumer Protection Act gives every consumer the right to a refund "
+                                        "or replacement when goods are defective. Complaints go to the District Commission.",
+    "bombay/landmark_cases.txt": "In this case the court held that Article 21 protects the right to life and "
+                                 "personal liberty, which includes the right to a fair procedure.",
+    "delhi/tenancy_notes.txt": "A landlord must give written notice before eviction. Rent disputes are heard "
+                               "by the Rent Controller.",
+}
+
+class CountingEmbedder(LocalEmbedder):
+    """LocalEmbedder that records how many texts it embedded."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.texts = 0
+
+    def embed(self, texts):
+        self.texts += len(texts)
+        return super().embed(texts)
+
+def write_corpus(corpus_dir, files):
+    for relative_path, text in files.items():
+        path = os.path.join(corpus_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+def store_snapshot(vector_store_dir):
+    """{file name: contents} of a store directory, to check it was left untouched."""
+    snapshot = {}
+    for name in sorted(os.listdir(vector_store_dir)):
+        path = os.path.join(vector_store_dir, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                snapshot[name] = f.read()
+    return snapshot
+
+@pytest.fixture
+def corpus_dir(tmp_path):
+    directory = tmp_path / "corpus"
+    write_corpus(str(directory), CORPUS)
+    return str(directory)
+
+@pytest.fixture
+def build(corpus_dir, tmp_path):
+    """build_index over the test corpus into tmp_path/store, on one worker of each kind."""
+    vector_store_dir = str(tmp_path / "store")
+
+    def run(**options):
+        options.setdefault("embedder", LocalEmbedder())
+        return build_index(corpus_dir, options.pop("vector_store_dir", vector_store_dir),
+                           max_workers=1, parse_workers=1, **options)
+
+    run.vector_store_dir = vector_store_dir
+    return run
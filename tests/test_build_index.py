@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# /tests/test_build_index.py
+
+import os
+import json
+
+import numpy as np
+import pytest
+
+import build_index
+from build_index import build_versioned_index
+from chunk_store import CHUNK_STORE_FILE, ChunkStore
+from ingest import discover_files
+from sharded_store import resolve_store_dir
+from embedder import LocalEmbedder
+from conftest import CORPUS, CountingEmbedder, store_snapshot, write_corpus
+
+def load_manifest(vector_store_dir):
+    with open(os.path.join(vector_store_dir, "manifest.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def test_discover_files_includes_subdirectories(corpus_dir):
+    assert discover_files(corpus_dir) == sorted(CORPUS)
+    assert discover_files(corpus_dir, recursive=False) == ["consumer_protection_act_2019.txt"]
+
+def test_plain_build_indexes_subdirectories(build):
+    num_chunks = build()
+
+    assert num_chunks == len(CORPUS)
+    assert sorted(load_manifest(build.vector_store_dir)["files"]) == sorted(CORPUS)
+    chunks = ChunkStore(os.path.join(build.vector_store_dir, CHUNK_STORE_FILE))
+    assert sorted(chunk["source"] for chunk in chunks) == sorted(CORPUS)
+    chunks.close()
+
+def test_invalid_index_options_fail_before_parsing(build, monkeypatch):
+    build()
+    before = store_snapshot(build.vector_store_dir)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("documents were parsed")
+    monkeypatch.setattr(build_index, "iter_documents", fail)
+
+    with pytest.raises(ValueError, match="pq_m"):
+        build(index_options={"compression": "pq", "pq_m": 7})
+    assert store_snapshot(build.vector_store_dir) == before
+
+def test_failed_build_leaves_previous_store(build, corpus_dir, monkeypatch):
+    build()
+    before = store_snapshot(build.vector_store_dir)
+    write_corpus(corpus_dir, {"new_notes.txt": "A new document that the failed build must not publish."})
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(build_index, "save_embeddings", fail)
+
+    with pytest.raises(RuntimeError, match="disk full"):
+        build()
+    # No new chunks next to the old index, and no spool or staged files left behind.
+    assert store_snapshot(build.vector_store_dir) == before
+
+def test_incremental_build_reuses_unchanged_embeddings(build, corpus_dir):
+    build()
+    first = np.load(os.path.join(build.vector_store_dir, "embeddings.npy"))
+    write_corpus(corpus_dir, {"delhi/tenancy_notes.txt": "Edited: eviction needs a court order."})
+    os.remove(os.path.join(corpus_dir, "bombay", "landmark_cases.txt"))
+
+    embedder = CountingEmbedder()
+    assert build(embedder=embedder, incremental=True) == len(CORPUS) - 1
+
+    assert embedder.texts == 1
+    manifest = load_manifest(build.vector_store_dir)
+    assert sorted(manifest["files"]) == ["consumer_protection_act_2019.txt", "delhi/tenancy_notes.txt"]
+    # Files are indexed in path order: the act was row 1 and is now row 0.
+    second = np.load(os.path.join(build.vector_store_dir, "embeddings.npy"))
+    np.testing.assert_array_equal(second[0], first[1])
+
+def test_versioned_build_publishes_and_prunes(corpus_dir, tmp_path):
+    vector_store_dir = str(tmp_path / "versioned")
+    options = dict(corpus_dir=corpus_dir, embedder=LocalEmbedder(), max_workers=1, parse_workers=1)
+
+    versions = [build_versioned_index(vector_store_dir, keep_versions=2, **options) for _ in range(3)]
+
+    live_dir, current = resolve_store_dir(vector_store_dir)
+    assert current == versions[-1]
+    assert sorted(os.listdir(os.path.join(vector_store_dir, "versions"))) == sorted(versions[1:])
+    assert load_manifest(live_dir)["files"].keys() == CORPUS.keys()
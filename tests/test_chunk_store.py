@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# /tests/test_chunk_store.py
+
+import json
+
+import pytest
+
+from chunk_store import ChunkStore, ShardedChunks, convert_json, write_chunk_store
+
+CHUNKS = [
+    {"source": "consumer_protection_act_2019.txt", "text": "Refund for defective goods.", "chunk_id": 0,
+     "act": "Consumer Protection Act", "year": 2019, "doc_type": "act"},
+    {"source": "bombay/cases.txt", "text": "अनुच्छेद 21 — right to life", "chunk_id": 0,
+     "act": None, "year": None, "doc_type": "case_law"},
+    {"source": "empty.txt", "text": "", "chunk_id": 0},
+]
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "chunks.bin")
+    assert write_chunk_store(path, CHUNKS) == len(CHUNKS)
+
+    store = ChunkStore(path)
+    assert len(store) == len(CHUNKS)
+    assert list(store) == CHUNKS
+    assert store[-1] == CHUNKS[-1]
+    assert store.text(1) == CHUNKS[1]["text"]
+    assert "text" not in store.metadata(0)
+    with pytest.raises(IndexError):
+        store[len(CHUNKS)]
+    store.close()
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "chunks.json"
+    path.write_bytes(b"[" + b" " * 64 + b"]")
+    with pytest.raises(ValueError):
+        ChunkStore(str(path))
+
+def test_convert_json(tmp_path):
+    json_path = str(tmp_path / "chunks.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(CHUNKS, f)
+    store_path = str(tmp_path / "chunks.bin")
+    assert convert_json(json_path, store_path) == len(CHUNKS)
+
+    store = ChunkStore(store_path)
+    assert list(store) == CHUNKS
+    store.close()
+
+def test_sharded_chunks_index_globally(tmp_path):
+    paths = [str(tmp_path / "a.bin"), str(tmp_path / "b.bin")]
+    write_chunk_store(paths[0], CHUNKS[:2])
+    write_chunk_store(paths[1], CHUNKS[2:])
+
+    chunks = ShardedChunks([ChunkStore(path) for path in paths])
+    assert len(chunks) == len(CHUNKS)
+    assert [chunks[i] for i in range(len(chunks))] == CHUNKS
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# /tests/test_rag_service.py
+
+import json
+import time
+
+import numpy as np
+import pytest
+
+import rag_service
+from bench_rag import FakeGenerativeModel
+from build_index import build_versioned_index
+from embedder import LocalEmbedder
+from web_search import StubSearchBackend
+from conftest import CORPUS, write_corpus
+
+def make_system(vector_store_dir):
+    return rag_service.RAGSystem(vector_store_dir=vector_store_dir, embedder=LocalEmbedder(),
+                                 generative_model=FakeGenerativeModel(latency=0),
+                                 search_backend=StubSearchBackend())
+
+@pytest.fixture
+def system(build, monkeypatch):
+    build()
+    system = make_system(build.vector_store_dir)
+    monkeypatch.setattr(rag_service, "rag_system", system)
+    return system
+
+@pytest.fixture
+def client(system):
+    return rag_service.app.test_client()
+
+def test_first_stage_scores_without_reranker(system):
+    assert system.reranker is None
+
+    vector = system.search_local_docs("refund for defective goods", top_k=3, mode="vector")
+    distances = [doc["score"] for doc in vector]
+    assert distances == sorted(distances)
+
+    hybrid = system.search_local_docs("refund for defective goods", top_k=3, mode="hybrid")
+    assert hybrid[0]["source"] == "consumer_protection_act_2019.txt"
+    fused = [doc["score"] for doc in hybrid]
+    assert fused == sorted(fused, reverse=True)
+
+    lexical = system.search_local_docs("Article 21", top_k=3, mode="lexical")
+    assert [doc["source"] for doc in lexical] == ["bombay/landmark_cases.txt"]
+    assert lexical[0]["score"] > 0
+
+def test_filtered_search(system):
+    for mode in ("vector", "lexical", "hybrid"):
+        results = system.search_local_docs("right to life", top_k=3, mode=mode, filters={"doc_type": "act"})
+        assert [doc["source"] for doc in results] in ([], ["consumer_protection_act_2019.txt"])
+    with pytest.raises(ValueError):
+        system.search_local_docs("right to life", filters={"court": "delhi"})
+
+@pytest.mark.parametrize("body", [
+    {},
+    {"queries": []},
+    {"queries": ["ok", ""]},
+    {"queries": ["ok"], "top_k": 0},
+    {"queries": ["ok"], "top_k": "5"},
+    {"queries": ["ok"], "top_k": True},
+    {"queries": ["ok"], "concurrency": -1},
+    {"queries": ["ok"], "response_type": "essay"},
+    {"queries": ["ok"], "filters": {"court": "delhi"}},
+])
+def test_batch_rejects_invalid_requests(client, body):
+    response = client.post("/api/chat/batch", json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+def test_batch_streams_one_line_per_query(client):
+    response = client.post("/api/chat/batch", json={"queries": ["refund for defective goods", "Article 21"],
+                                                     "top_k": 2, "generate": False})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert response.status_code == 200
+    assert lines[-1]["done"] is True
+    results = sorted(lines[:-1], key=lambda result: result["index"])
+    assert [result["query"] for result in results] == ["refund for defective goods", "Article 21"]
+    assert all(len(result["scores"]) == len(result["sources"]) for result in results)
+
+def test_closing_answer_batch_cancels_pending_questions(system, monkeypatch):
+    started = []
+
+    def generate_response(query, *args):
+        started.append(query)
+        time.sleep(0.05)
+        return "answer"
+    monkeypatch.setattr(system, "generate_response", generate_response)
+
+    results = system.answer_batch([f"question {i}" for i in range(20)], concurrency=2)
+    next(results)
+    results.close()
+    time.sleep(0.3)
+    assert len(started) < 20
+
+def test_reload_picks_up_new_version(corpus_dir, tmp_path):
+    vector_store_dir = str(tmp_path / "versioned")
+    options = dict(corpus_dir=corpus_dir, embedder=LocalEmbedder(), max_workers=1, parse_workers=1)
+    first = build_versioned_index(vector_store_dir, **options)
+    system = make_system(vector_store_dir)
+    system.answer_cache.store(np.ones(8, dtype='float32'), {"response": "cached"}, 1.0)
+    assert system.answer_cache.lookup(np.ones(8, dtype='float32')) is not None
+    assert system.store.version == first
+    assert system.reload() == "unchanged"
+
+    write_corpus(corpus_dir, {"new_notes.txt": "Notes on the Right to Information Act and public records."})
+    second = build_versioned_index(vector_store_dir, **options)
+
+    old_store = system.store
+    assert system.reload() == "reloaded"
+    assert system.store.version == second
+    assert len(system.store.chunks) == len(old_store.chunks) + 1 == len(CORPUS) + 1
+    assert system.answer_cache.lookup(np.ones(8, dtype='float32')) is None
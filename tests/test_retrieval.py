@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# /tests/test_retrieval.py
+
+import faiss
+import numpy as np
+import pytest
+
+from filter_index import FilterIndex
+from lexical_index import LexicalIndex, ShardedLexicalIndex, reciprocal_rank_fusion
+from vector_index import IdSelection, ShardedIndex, create_index, search_index, validate_index_params
+
+TEXTS = [
+    "Article 21 protects the right to life and personal liberty.",
+    "A consumer may claim a refund for defective goods.",
+    "The landlord must give notice before eviction.",
+    "Refund claims under the Consumer Protection Act go to the District Commission.",
+]
+
+METADATA = [
+    {"source": "constitution.txt", "doc_type": "constitution", "year": None},
+    {"source": "consumer_protection_act_2019.txt", "doc_type": "act", "year": 2019},
+    {"source": "delhi/tenancy.txt", "doc_type": "other", "year": 2015},
+    {"source": "consumer_protection_act_2019.txt", "doc_type": "act", "year": 2019},
+]
+
+def random_vectors(count, dimension=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype('float32')
+
+def test_bm25_ranks_matching_documents(tmp_path):
+    index = LexicalIndex.build(TEXTS)
+
+    results = index.search("consumer refund", top_k=3)
+    assert [doc_id for doc_id, _ in results][:2] in ([1, 3], [3, 1])
+    assert all(score > 0 for _, score in results)
+    restricted = index.search("consumer refund", top_k=3, ids=np.array([3]))
+    assert restricted == [result for result in results if result[0] == 3]
+    assert index.search("unrelated words", top_k=3) == []
+
+    path = str(tmp_path / "lexical_index.npz")
+    index.save(path)
+    assert LexicalIndex.load(path).search("consumer refund", top_k=3) == results
+
+def test_sharded_bm25_offsets_ids():
+    index = ShardedLexicalIndex([LexicalIndex.build(TEXTS[:2]), LexicalIndex.build(TEXTS[2:])])
+
+    assert {doc_id for doc_id, _ in index.search("refund", top_k=5)} == {1, 3}
+    assert [doc_id for doc_id, _ in index.search("refund", top_k=5, ids=np.array([3]))] == [3]
+
+def test_reciprocal_rank_fusion_scores():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+
+    assert [doc_id for doc_id, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+def test_filter_index_select():
+    index = FilterIndex.build(METADATA)
+
+    assert index.select(None) is None
+    assert index.select({"doc_type": "ACT"}).ids.tolist() == [1, 3]
+    assert index.select({"doc_type": ["act", "other"]}).ids.tolist() == [1, 2, 3]
+    assert index.select({"doc_type": "act", "year": 2015}).ids.tolist() == []
+    assert index.select({"source": "delhi/tenancy.txt"}).ids.tolist() == [2]
+    # Cached per normalized filter, so its FAISS selector is built only once.
+    assert index.select({"doc_type": ["other", "act"]}) is index.select({"doc_type": ["act", "other"]})
+    with pytest.raises(ValueError):
+        index.select({"court": "delhi"})
+
+def test_filter_index_round_trip_and_concatenate(tmp_path):
+    index = FilterIndex.build(METADATA)
+    path = str(tmp_path / "filter_index.npz")
+    index.save(path)
+    assert FilterIndex.load(path).select({"doc_type": "act"}).ids.tolist() == [1, 3]
+
+    merged = FilterIndex.concatenate([FilterIndex.build(METADATA[:2]), FilterIndex.build(METADATA[2:])], [0, 2])
+    assert merged.select({"doc_type": "act"}).ids.tolist() == [1, 3]
+
+def test_sharded_search_matches_single_index():
+    vectors = random_vectors(200)
+    queries = random_vectors(5, seed=1)
+    single = faiss.IndexFlatL2(16)
+    single.add(vectors)
+    shards = []
+    for part in (vectors[:80], vectors[80:]):
+        shard = faiss.IndexFlatL2(16)
+        shard.add(part)
+        shards.append(shard)
+
+    expected_distances, expected_ids = single.search(queries, 10)
+    distances, ids = ShardedIndex(shards).search(queries, 10)
+
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+
+def test_selection_restricts_sharded_and_compressed_search():
+    vectors = random_vectors(400)
+    queries = random_vectors(3, seed=1)
+    selection = IdSelection(np.arange(50, 400, 7))
+    sharded = ShardedIndex([create_index(part, "flat")[0] for part in (vectors[:150], vectors[150:])])
+    compressed, _ = create_index(vectors, "flat", compression="pq", pq_m=4, pq_nbits=4)
+
+    for index in (sharded, compressed):
+        _, ids = search_index(index, queries, 5, ids=selection)
+        assert set(ids.ravel().tolist()) <= set(selection.ids.tolist())
+    # Each shard's selection is made once and reused.
+    assert selection.shard(150, 400) is selection.shard(150, 400)
+    assert selection.shard(150, 400).ids.min() >= 0
+
+def test_validate_index_params():
+    assert validate_index_params("flat", 768, "pq", pq_m=8)["compression"] == "pq"
+    with pytest.raises(ValueError, match="pq_m"):
+        validate_index_params("flat", 768, "pq", pq_m=7)
+    with pytest.raises(ValueError, match="ivf_pq"):
+        validate_index_params("ivf_pq", 768, "int8")
+    with pytest.raises(ValueError, match="Unknown compression"):
+        validate_index_params("hnsw", 768, "zip")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# /tests/test_structured_stream.py
+
+import json
+
+from structured_stream import StructuredSectionParser
+
+ANSWER = {
+    "summaryOfRights": "You are entitled to a refund.",
+    "relevantActsAndArticles": [{"name": "Consumer Protection Act, 2019", "explanation": "Defines rights."}],
+    "confidence": 0.85,
+    "nextSteps": ["Send a written notice.", "File a complaint."],
+}
+
+def feed_all(parser, fragments):
+    sections = []
+    for fragment in fragments:
+        sections.extend(parser.feed(fragment))
+    return sections
+
+def test_sections_are_reported_as_they_finish():
+    parser = StructuredSectionParser()
+    text = json.dumps(ANSWER)
+
+    first = parser.feed(text[:text.index('"relevantActsAndArticles"')])
+    assert first == [("summaryOfRights", ANSWER["summaryOfRights"])]
+    rest = feed_all(parser, text[len(text[:text.index('"relevantActsAndArticles"')]):])
+
+    assert [key for key, _ in first + rest] == list(ANSWER)
+    assert parser.finished and parser.result == ANSWER
+
+def test_character_by_character():
+    parser = StructuredSectionParser()
+    sections = feed_all(parser, "Here you go:\n```json\n" + json.dumps(ANSWER, indent=2) + "\n```")
+
+    assert dict(sections) == ANSWER
+    assert parser.finished
+
+def test_number_split_across_fragments():
+    parser = StructuredSectionParser()
+
+    assert parser.feed('{"n": 12.') == []
+    assert parser.feed('5, "s": "x"}') == [("n", 12.5), ("s", "x")]
+    assert parser.finished
+
+def test_number_waits_for_a_delimiter():
+    parser = StructuredSectionParser()
+
+    assert parser.feed('{"n": 1') == []
+    assert parser.feed('2') == []
+    assert parser.feed('e3') == []
+    assert parser.feed('}') == [("n", 12000.0)]
+    assert parser.finished